@@ -5,7 +5,7 @@ from langchain.messages import AIMessage
 from langchain.tools import tool
 
 from agents.collector import invoke_collector
-from agents.searcher import Searcher
+from agents.searcher import get_searcher
 from settings import settings
 
 from utils import extract_text_from_message_content
@@ -56,7 +56,7 @@ def handoff_to_RAG(query: str):
     """
     logger.info(f"Invoking RAG Searcher for query: {query}")
     try:
-        searcher = Searcher()
+        searcher = get_searcher()
         hits = searcher.search(query)
         formatted = searcher.format_hits(hits)
         logger.success(f"RAG search completed with {len(hits)} hits: {formatted}")
@@ -14,7 +14,9 @@ import json
 import uuid
 import traceback
 import re
+import subprocess
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Tuple, cast
 from langchain.agents import create_agent
@@ -31,6 +33,7 @@ from prompts.template import apply_prompt_template
 from utils import extract_text_from_message_content, extract_json_from_codeblock
 from utils.trace_logger import append_jsonl, truncate_text, safe_serialize
 from utils.selector_verifier import verify_selectors
+from utils.json_utils import json_dumps
 from utils.trace_logger import COT_INSTRUCTION, TrajectoryCollector
 
 from logging_config import logger
@@ -208,6 +211,8 @@ def _augment_messages_with_intermediate_steps(messages: List[Dict[str, Any]], in
 
     return augmented
 
+_BASH_EXEC_TIMEOUT_S = 60
+
 @tool
 def bash_exec(cmd:str) -> str:
     '''
@@ -220,8 +225,16 @@ def bash_exec(cmd:str) -> str:
     '''
     logger.info(f"Executing bash command: {cmd}")
     try:
-        output = os.popen(cmd).read()
-        return output
+        # 直接调用 bash，不经过 os.popen 的 /bin/sh 中转；超时防止命令挂住 agent
+        proc = subprocess.run(
+            ["bash", "-c", cmd],
+            capture_output=True,
+            text=True,
+            timeout=_BASH_EXEC_TIMEOUT_S,
+        )
+        return proc.stdout + proc.stderr
+    except subprocess.TimeoutExpired:
+        return f"An error occurred: command timed out after {_BASH_EXEC_TIMEOUT_S}s"
     except Exception as e:
         return f"An error occurred: {e}"
 
@@ -240,11 +253,11 @@ def read_file(filename: str, offset: int, chunk_size: int) -> str:
     '''
     logger.info(f"Reading file: {filename} from line: {offset} with {chunk_size} lines")
     try:
-        with open(f"htmls/{filename}", "r", encoding='utf-8') as f:
-            lines = f.readlines()
-            # Read chunk_size lines starting from offset
-            end_line = min(offset + chunk_size, len(lines))
-            return "".join(lines[offset:end_line])
+        # 二进制模式逐行流式读取，只取 [offset, offset + chunk_size) 的行，
+        # 不把整个 HTML 读进内存；多字节字符解码失败时替换而不是报错
+        with open(f"htmls/{filename}", "rb") as f:
+            data = b"".join(islice(f, offset, offset + chunk_size))
+        return data.decode("utf-8", errors="replace")
     except Exception as e:
         return f"An error occurred: {e}"
 
@@ -279,7 +292,7 @@ def verify_selectors_tool(html_path: str, selector_json: str) -> str:
     
     try:
         result = verify_selectors(html_path, selector_json)
-        return json.dumps(result, ensure_ascii=False, indent=2)
+        return json_dumps(result, indent=True)
     except Exception as e:
         error_result = {
             "ok": False,
@@ -287,7 +300,7 @@ def verify_selectors_tool(html_path: str, selector_json: str) -> str:
             "metrics": {},
             "diagnostics": {"error": str(e)}
         }
-        return json.dumps(error_result, ensure_ascii=False, indent=2)
+        return json_dumps(error_result, indent=True)
 
 
 def get_html_selector_by_llm(url: str, selector_target: str | None = None) -> str:
@@ -0,0 +1,90 @@
+"""Searcher 结果投影与格式化（纯函数）。
+
+这里只包含带完整类型注解、无动态特性的纯 Python 代码，可以直接用 mypyc 编译：
+
+    mypyc src/agents/searcher_fmt.py
+
+编译出的扩展模块与 .py 同名，存在时会被优先导入；未编译时自动使用纯 Python 版本。
+"""
+from typing import Any, Dict, List
+
+from parser.section_category import SECTION_CATEGORY_NAMES
+
+# Marker set on the synthetic hit that wraps an agentic answer
+AGENTIC_KIND = "agentic"
+
+# (field, default) pairs projected from raw RAG hits into Searcher hits
+HIT_FIELDS: tuple[tuple[str, Any], ...] = (
+    ("title", ""),
+    ("abstract", ""),
+    ("url", ""),
+    ("doc_id", ""),
+    ("score", 0.0),
+    ("conference_name", ""),
+    ("conference_year", ""),
+    ("conference_round", ""),
+    ("section_category", 0),
+    ("parent_section", ""),
+    ("page_number", 0),
+)
+
+
+def project_hits(raw_hits: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+    """Project raw RAG hits onto the Searcher hit schema, numbering them from 1."""
+    return [
+        {"id": idx, **{field: hit.get(field, default) for field, default in HIT_FIELDS}}
+        for idx, hit in enumerate(raw_hits[:k], 1)
+    ]
+
+
+def format_hits(hits: List[Dict[str, Any]], max_len: int = 600) -> str:
+    """Render hits into concise numbered blocks for the coordinator."""
+    if not hits:
+        return "No relevant documents found."
+    
+    # Agentic answers are already prose: return before any per-hit work
+    first = hits[0]
+    if first.get("_kind") == AGENTIC_KIND:
+        return first.get("abstract") or "No answer generated."
+    
+    # 所有片段写进同一个 list，最后一次 join，避免每个 block 先拼出中间字符串
+    parts: List[str] = []
+    for h in hits:
+        # 每个字段只取一次
+        title = h.get("title") or "Untitled"
+        url = h.get("url") or "N/A"
+        abstract = h.get("abstract") or ""
+        conference_name = h.get("conference_name")
+        conference_year = h.get("conference_year")
+        cat_id = h.get("section_category", 0)
+        parent = h.get("parent_section")
+        page = h.get("page_number")
+
+        meta_parts: List[str] = []
+        if conference_name:
+            meta_parts.append(str(conference_name))
+        if conference_year:
+            meta_parts.append(str(conference_year))
+        
+        # Add structure info to metadata
+        cat_name = SECTION_CATEGORY_NAMES.get(cat_id, "UNKNOWN")
+        
+        if cat_name != "ABSTRACT":
+            meta_parts.append("Section: " + cat_name)
+        
+        if parent:
+            meta_parts.append(f"Parent: {parent}")
+            
+        if page and page > 0:
+            meta_parts.append(f"Page: {page}")
+
+        if len(abstract) > max_len:
+            abstract = abstract[:max_len] + "..."
+
+        if parts:
+            parts.append("\n\n")
+        parts.extend(("[", str(h["id"]), "] ", title, "\n"))
+        if meta_parts:
+            parts.extend((" | ".join(meta_parts), "\n"))
+        parts.extend(("URL: ", url, "\nContent: ", abstract))
+    return "".join(parts)
@@ -0,0 +1,1065 @@
+"""Agentic Retrieval 工具集。
+
+所有 @tool 定义集中在此模块，只在导入时注册一次；Searcher 只负责组装 agent。
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Hashable, Iterable, Iterator, List, Optional
+import asyncio
+import re
+import threading
+
+from logging_config import log_enabled, logger
+from rag.retriever import RAG, bump_corpus_epoch, corpus_epoch, get_rag_client_by_provider
+from rag.pdf_loader import PDFLoader, LoadResult, LoadStatus
+from rag.kv_cache import get_kv_cache, make_key
+from parser.section_category import SECTION_CATEGORY_NAMES
+from settings import settings
+from utils import extract_text_from_message_content
+from utils.json_utils import json_dumps, json_loads, parse_llm_json
+from models import cacheable_system_message, get_llm_by_usage
+from langchain.tools import tool
+
+_BAR = "=" * 80
+
+# PDF loader per RAG client (the loader inserts chunks into the client it was built with)
+# 工具可能被并发调用，初始化时加锁避免重复创建连接
+_pdf_loaders: dict[RAG, PDFLoader] = {}
+_init_lock = threading.Lock()
+
+# 可通过 use_rag_client() 替换工具使用的 RAG client（检索与 PDF 入库都走它），不影响其他并发请求；
+# Searcher.search 经 run_sync 执行时会带上调用方的 context
+_rag_client_override: ContextVar[RAG | None] = ContextVar("rag_client_override", default=None)
+
+def _get_rag_client():
+    override = _rag_client_override.get()
+    if override is not None:
+        return override
+    # get_rag_client_by_provider 自带线程安全的实例缓存
+    return get_rag_client_by_provider(settings.rag_provider)
+
+@contextmanager
+def use_rag_client(client: RAG) -> Iterator[RAG]:
+    token = _rag_client_override.set(client)
+    try:
+        yield client
+    finally:
+        _rag_client_override.reset(token)
+
+# 一次 agentic 检索中已经返回给 agent 的论文；search_abstracts 默认在向量检索里排除它们
+_session_seen: ContextVar[set[str] | None] = ContextVar("session_seen_doc_ids", default=None)
+
+@contextmanager
+def search_session() -> Iterator[set[str]]:
+    """开启一次检索会话；会话外调用工具时不做跨调用去重"""
+    seen: set[str] = set()
+    token = _session_seen.set(seen)
+    try:
+        yield seen
+    finally:
+        _session_seen.reset(token)
+
+def _seen_exclusion(exclude_seen: bool) -> tuple[str, ...]:
+    seen = _session_seen.get()
+    if not exclude_seen or not seen:
+        return ()
+    return tuple(sorted(seen))
+
+def _mark_seen(doc_ids: Iterable[str]) -> None:
+    seen = _session_seen.get()
+    if seen is not None:
+        seen.update(d for d in doc_ids if d)
+
+def _get_pdf_loader() -> PDFLoader:
+    rag_client = _get_rag_client()
+    loader = _pdf_loaders.get(rag_client)
+    if loader is None:
+        with _init_lock:
+            loader = _pdf_loaders.get(rag_client)
+            if loader is None:
+                if settings.chunk_strategy == "contextual":
+                    logger.info("Initializing PDFLoader with contextual chunking strategy.")
+                    loader = PDFLoader(rag_client, llm_client=get_llm_by_usage('contextual'))
+                else:
+                    loader = PDFLoader(rag_client)
+                _pdf_loaders[rag_client] = loader
+    return loader
+
+# 已确认 chunks 入库的 doc_id，重复请求时不再经过 PDFLoader；按 _cache_scope(client) 分组，
+# 切换 client/collection 或语料被其他路径改写（如 collection 重建）后自动失效
+_loaded_doc_ids: dict[tuple, set[str]] = {}
+_loaded_lock = threading.Lock()
+
+
+def _loaded_set(client: RAG) -> set[str]:
+    """当前 scope 下已入库的 doc_id；同一 client/collection 旧版本号的条目一并丢弃"""
+    scope = _cache_scope(client)
+    with _loaded_lock:
+        loaded = _loaded_doc_ids.get(scope)
+        if loaded is None:
+            for key in [k for k in _loaded_doc_ids if k[:2] == scope[:2]]:
+                del _loaded_doc_ids[key]
+            loaded = _loaded_doc_ids[scope] = set()
+        return loaded
+
+# Global LLM for agentic tools
+_agentic_llm = None
+
+def _get_agentic_llm():
+    global _agentic_llm
+    if _agentic_llm is None:
+        with _init_lock:
+            if _agentic_llm is None:
+                _agentic_llm = get_llm_by_usage('agentic')
+    return _agentic_llm
+
+class _ResultCache:
+    """进程内检索结果 LRU 缓存，key 为 (client, collection, 语料版本号, 归一化后的查询参数)"""
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_result_cache = _ResultCache()
+
+
+def _invalidate_corpus_caches() -> None:
+    """RAG 的各个 insert 路径都会递增语料版本号；这里额外清掉已过期的条目"""
+    bump_corpus_epoch()
+    _result_cache.clear()
+
+
+def _cache_scope(client: RAG) -> tuple:
+    """缓存 key 的公共前缀：同一 client 切换 collection、或有新数据入库后都不会命中旧结果"""
+    return (client, getattr(client, "collection", None), corpus_epoch())
+
+
+@lru_cache(maxsize=1024)
+def _context_window_impl(client: RAG, collection: Optional[str], doc_id: str, chunk_id: int, window: int, epoch: int) -> str:
+    context = client.get_context_window(doc_id, chunk_id, window)
+    if not context:
+        return "Could not retrieve context for this chunk."
+    return f"[Context Window for doc_id={doc_id}, chunk_id={chunk_id}]\n\n{context}"
+
+
+def _dumps_compact(obj: Any) -> str:
+    """工具输出用紧凑 JSON，比带缩进/标签的文本格式少很多 token"""
+    return json_dumps(obj)
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+async def _cached_search_abstracts(query: str, k: int, exclude: tuple[str, ...] = ()) -> List[dict]:
+    client = _get_rag_client()
+    key = (*_cache_scope(client), "abstracts", _normalize_query(query), k, exclude)
+    results = _result_cache.get(key)
+    if results is None:
+        results = await asyncio.to_thread(
+            client.search_abstracts, query, k, list(exclude) or None
+        )
+        _result_cache.put(key, results)
+    return results
+
+
+async def _cached_search_by_section(query: str, doc_id: str | None, section_category: int | None, k: int) -> List[dict]:
+    client = _get_rag_client()
+    key = (*_cache_scope(client), "section", _normalize_query(query), doc_id, section_category, k)
+    results = _result_cache.get(key)
+    if results is None:
+        results = await asyncio.to_thread(
+            client.search_by_section,
+            query,
+            doc_id=doc_id,
+            section_category=section_category,
+            k=k,
+        )
+        _result_cache.put(key, results)
+    return results
+
+
+async def _cached_search_by_sections_multi(query: str, doc_ids: List[str], section_category: int | None, k: int) -> List[dict]:
+    client = _get_rag_client()
+    key = (*_cache_scope(client), "sections_multi", _normalize_query(query), tuple(sorted(doc_ids)), section_category, k)
+    results = _result_cache.get(key)
+    if results is None:
+        results = await asyncio.to_thread(
+            client.search_by_sections_multi,
+            query,
+            list(doc_ids),
+            section_category=section_category,
+            k=k,
+        )
+        _result_cache.put(key, results)
+    return results
+
+
+def _parse_llm_json(content: Any) -> Any:
+    """三个 LLM 工具共用的 JSON 解析：处理 list 形式的 content、代码块围栏和可修复的格式错误"""
+    if not isinstance(content, str):
+        content = extract_text_from_message_content(content)
+    return parse_llm_json(content)
+
+
+_SCORE_LINE_RE = re.compile(r"^\s*\[?(\d+)\]?\s*[:=]\s*(\d+(?:\.\d+)?)", re.MULTILINE)
+
+
+def _squash_ws(text: str, limit: int) -> str:
+    """折叠连续空白/换行并截断到 limit 个字符"""
+    return " ".join(text.split())[:limit]
+
+
+def _parse_rerank_scores(content: Any) -> dict[int, float]:
+    """解析 rerank 输出的 "index:score" 行；模型仍返回 JSON 数组时退回 JSON 解析"""
+    if not isinstance(content, str):
+        content = extract_text_from_message_content(content)
+    score_map = {int(i): float(score) for i, score in _SCORE_LINE_RE.findall(content)}
+    if score_map:
+        return score_map
+    scores = _parse_llm_json(content)
+    return {s["index"]: s["score"] for s in scores if "index" in s and "score" in s}
+
+
+def _llm_cache_key(llm, prompt: str) -> bytes:
+    """查询改写结果的持久化缓存 key: SHA-256(model || common prefix || prompt)"""
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", "") or type(llm).__name__
+    return make_key(str(model), _COMMON_PREFIX, prompt)
+
+
+def _tool_messages(llm, prompt: str) -> list[dict[str, Any]]:
+    """所有分析类工具共用同一条 system 前缀，只有 user 消息随调用变化"""
+    return [cacheable_system_message(llm, _COMMON_PREFIX), {"role": "user", "content": prompt}]
+
+
+def _invoke_tool_llm(llm, prompt: str):
+    return llm.invoke(_tool_messages(llm, prompt))
+
+
+# schema 中 "reasoning" 总是最后一个字段；流式输出一旦开始写它，前面的决策字段就已经完整
+_REASONING_KEY_RE = re.compile(r',\s*"reasoning"\s*:')
+_LEADING_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*")
+
+
+def _stream_tool_llm_json(llm, prompt: str, required_keys: tuple[str, ...]) -> dict[str, Any]:
+    """流式调用 LLM，在 JSON 对象的决策字段写完后立即断开，省掉尾部 reasoning 的输出 token。
+
+    没有出现 reasoning 字段、或截断后的对象缺少 required_keys 时，读完整个响应再解析。
+    """
+    if not settings.agentic_early_stop_json:
+        response = _invoke_tool_llm(llm, prompt)
+        return _parse_llm_json(response.content if hasattr(response, 'content') else str(response))
+
+    parts: list[str] = []
+    scanned = 0
+    stream = llm.stream(_tool_messages(llm, prompt))
+    try:
+        for chunk in stream:
+            parts.append(extract_text_from_message_content(getattr(chunk, "content", chunk)))
+            buffer = "".join(parts)
+            # 只扫描新到达的部分（回退一点以覆盖跨 chunk 的 key）
+            m = _REASONING_KEY_RE.search(buffer, max(0, scanned - 32))
+            scanned = len(buffer)
+            if m is None:
+                continue
+            head = _LEADING_FENCE_RE.sub("", buffer[:m.start()], count=1)
+            try:
+                parsed = json_loads(head + "}")
+            except ValueError:
+                continue
+            if isinstance(parsed, dict) and all(key in parsed for key in required_keys):
+                logger.debug("Stopped LLM stream early before the reasoning field")
+                return parsed
+    finally:
+        # 关闭生成器会断开底层 HTTP 流，服务端停止生成
+        stream.close()
+    return _parse_llm_json("".join(parts))
+
+
+# ============== Prompt Templates ==============
+# 静态模板在导入时构建一次，调用时只用 str.format_map 填入变量（JSON 示例中的花括号已转义为 {{ }}）
+
+# 四个分析类工具共享的 system 前缀：逐字节相同，provider 侧前缀缓存才能跨工具命中。
+# 修改这段文字会让已有的 kv cache 和 provider 缓存全部失效。
+_COMMON_PREFIX = """You are the retrieval assistant of an academic paper search system. The system indexes \
+papers from computer science conferences: every paper has a title, an abstract and, once its PDF \
+is loaded, body chunks grouped by section (abstract, introduction, method, experiment, related \
+work, conclusion). A retrieval agent calls you for narrowly scoped sub-tasks while it answers a \
+user's research question: analysing the query into sub-queries, writing hypothetical documents \
+for dense retrieval, judging whether the papers found so far cover the question, and scoring \
+candidate papers for relevance.
+
+General rules for every task:
+- Work only with the information given in the task; do not invent paper titles, authors, venues, \
+numbers or citations.
+- Use precise technical terminology from the research area of the query, including common \
+synonyms and abbreviations, because your output is embedded and matched against paper text.
+- Be concise. Do not restate the task, do not add greetings, caveats or closing remarks.
+- When the task asks for JSON, reply with exactly one valid JSON value: no markdown code fences, \
+no comments, no trailing commas, double-quoted keys and strings, and true/false for booleans.
+- When the task asks for a line-based format, reply with those lines only, one item per line.
+- When the task asks for prose, reply with plain text paragraphs only.
+- If the input is empty or unusable, still reply in the requested format with your best \
+neutral answer rather than an explanation.
+
+The task follows."""
+
+_HYDE_INSTRUCTION_ON = """
+If should_use_hyde is true, also write "hypothetical_docs": one short hypothetical
+abstract-style paragraph (3-5 sentences) per sub-query, in the same order as sub_queries,
+as if taken from a paper that perfectly answers it. Use key technical terms; no citations.
+If should_use_hyde is false, set "hypothetical_docs" to [].
+"""
+
+_HYDE_INSTRUCTION_OFF = """
+Always set "hypothetical_docs" to [].
+"""
+
+_ANALYZE_PROMPT = """You are a research query analyzer. Analyze the following user query and generate a retrieval strategy.
+
+User Query: "{query}"
+
+Your task:
+1. Identify the query type (comparison, definition, survey, technical_detail, or other)
+2. Extract key concepts and terminology
+3. Generate 2-4 sub-queries that progressively explore different aspects
+   - Start with broad/general queries
+   - Progress to specific/detailed queries
+4. Estimate query complexity (high/medium/low)
+5. Decide if HyDE (hypothetical document generation) would help
+
+Guidelines for sub-queries:
+- For comparisons: separate queries for each entity, then comparison
+- For surveys: broad overview first, then specific techniques/methods
+- For technical details: background first, then specific mechanisms
+- Each sub-query should be self-contained and searchable
+{hyde_instruction}
+Respond ONLY with a valid JSON object (no markdown, no explanations):
+{{
+  "query_type": "comparison|definition|survey|technical_detail|other",
+  "key_concepts": ["concept1", "concept2"],
+  "sub_queries": ["query1", "query2", "query3"],
+  "estimated_complexity": "high|medium|low",
+  "should_use_hyde": true|false,
+  "hypothetical_docs": ["doc for query1", "doc for query2", "doc for query3"],
+  "reasoning": "brief explanation of strategy"
+}}"""
+
+_ANALYZE_REQUIRED_KEYS = ("query_type", "sub_queries", "should_use_hyde")
+
+_HYDE_PROMPT = """You are an expert researcher. Generate a hypothetical answer to the following query.
+
+Query: "{query}"
+
+Write a detailed, well-structured answer (2-3 paragraphs) as if you were writing an abstract or introduction section of a research paper that perfectly answers this query.
+
+Include:
+- Key technical terms and concepts
+- Relevant methodologies or approaches
+- Expected findings or conclusions
+- References to common techniques or frameworks
+
+Do NOT include citations like [1] or [2]. Just write the content.
+
+Your hypothetical answer:"""
+
+_EVALUATE_PROMPT = """You are evaluating the sufficiency of retrieved research papers.
+
+Original Query: "{original_query}"
+
+Current Round: {round_number}
+
+Retrieved Papers So Far:
+{retrieved_titles}
+
+Your task:
+1. Assess if the retrieved papers adequately cover the query
+2. Identify any missing aspects or gaps
+3. Decide if more retrieval rounds are needed
+4. If continuing, suggest what to focus on next
+
+Guidelines:
+- Round 1-2: Usually continue unless results are perfect
+- Round 3+: Only continue if critical information is missing
+- Max 4 rounds recommended to avoid diminishing returns
+
+Respond ONLY with a valid JSON object (no markdown, no explanations):
+{{
+  "is_sufficient": true|false,
+  "coverage_score": 0.0-1.0,
+  "missing_aspects": ["aspect1", "aspect2"],
+  "should_continue": true|false,
+  "next_focus": "description of what to search next",
+  "reasoning": "brief explanation"
+}}"""
+
+_EVALUATE_REQUIRED_KEYS = ("is_sufficient", "coverage_score", "should_continue", "next_focus")
+
+# 评估只需要知道覆盖了哪些论文：最多 40 个标题、总长约 2 KB
+_EVAL_MAX_TITLES = 40
+_EVAL_TITLE_MAX_CHARS = 150
+_EVAL_TITLES_BUDGET = 2048
+
+
+def _titles_within_budget(titles: List[str]) -> str:
+    """把标题列表裁剪到固定预算内，每行一个；超出部分只报告数量"""
+    lines: list[str] = []
+    used = 0
+    for title in titles[:_EVAL_MAX_TITLES]:
+        line = f"- {_squash_ws(str(title), _EVAL_TITLE_MAX_CHARS)}"
+        if used + len(line) > _EVAL_TITLES_BUDGET:
+            break
+        lines.append(line)
+        used += len(line) + 1
+    if len(lines) < len(titles):
+        lines.append(f"... and {len(titles) - len(lines)} more papers")
+    return "\n".join(lines) if lines else "(none)"
+
+_RERANK_PROMPT = """You are a research paper relevance evaluator. Rate the relevance of each paper to the query.
+
+Query: "{original_query}"
+
+Papers:
+{papers}
+
+Your task:
+For each paper, assign a relevance score from 0-10:
+- 9-10: Highly relevant, directly addresses the query
+- 7-8: Relevant, covers important aspects
+- 5-6: Somewhat relevant, tangentially related
+- 3-4: Marginally relevant
+- 0-2: Not relevant or off-topic
+
+Respond ONLY with one line per paper in the form index:score (no markdown, no explanations), e.g.
+1:8.5
+2:7.0
+..."""
+
+
+# ============== Phase 1: Agentic Retrieval Tools ==============
+
+@tool
+def analyze_query(query: str, include_hyde: bool = True) -> str:
+    """
+    [Phase 1] 分析用户查询，生成检索策略和多个子查询。
+    这是 Agentic Retrieval 的第一步，必须在检索前调用！
+    
+    Args:
+        query: 用户的原始查询
+        include_hyde: 若 LLM 判断需要 HyDE，是否在同一次调用中直接生成假想文档（默认 True）
+    
+    Returns:
+        JSON格式的分析结果，包含：
+        - query_type: 查询类型（comparison/definition/survey/technical_detail）
+        - key_concepts: 关键概念列表
+        - sub_queries: 子查询列表（按优先级排序）
+        - estimated_complexity: 复杂度（high/medium/low）
+        - should_use_hyde: 是否应该使用 HyDE
+        - hypothetical_docs: 与 sub_queries 一一对应的假想文档（不需要 HyDE 时为空列表）
+    """
+    logger.info(_BAR)
+    logger.info("🎯 [PHASE 1: QUERY ANALYSIS] Starting query analysis...")
+    logger.info(f"📝 Original Query: {query}")
+    logger.info(_BAR)
+    
+    llm = _get_agentic_llm()
+    
+    # HyDE 文档与子查询在同一次 LLM 调用中生成，省掉后续 k 次 generate_hypothetical_answer
+    hyde_instruction = _HYDE_INSTRUCTION_ON if include_hyde else _HYDE_INSTRUCTION_OFF
+    
+    prompt = _ANALYZE_PROMPT.format_map({"query": query, "hyde_instruction": hyde_instruction})
+    
+    cache = get_kv_cache()
+    cache_key = _llm_cache_key(llm, prompt)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info("♻️  Query analysis cache hit")
+            return cached.decode("utf-8")
+    
+    try:
+        analysis = _stream_tool_llm_json(llm, prompt, _ANALYZE_REQUIRED_KEYS)
+        
+        analysis.setdefault("hypothetical_docs", [])
+        logger.success("✅ Query analysis completed successfully!")
+        if log_enabled("INFO"):
+            logger.info(f"   📊 Query Type: {analysis.get('query_type')}")
+            logger.info(f"   🔥 Complexity: {analysis.get('estimated_complexity')}")
+            logger.info(f"   🔑 Key Concepts: {', '.join(analysis.get('key_concepts', []))}")
+            logger.info(f"   📋 Generated {len(analysis.get('sub_queries', []))} sub-queries:")
+            for i, sq in enumerate(analysis.get('sub_queries', []), 1):
+                logger.info(f"      {i}. {sq}")
+            logger.info(f"   🚀 Use HyDE: {analysis.get('should_use_hyde')} ({len(analysis['hypothetical_docs'])} docs generated)")
+            logger.info(f"   💡 Reasoning: {analysis.get('reasoning', 'N/A')}")
+            logger.info(_BAR)
+        
+        output = _dumps_compact(analysis)
+        if cache is not None:
+            cache.put(cache_key, output.encode("utf-8"))
+        return output
+    except Exception as e:
+        logger.error(f"❌ Query analysis failed: {e}")
+        # Fallback: return simple analysis
+        fallback = {
+            "query_type": "other",
+            "key_concepts": [query],
+            "sub_queries": [query],
+            "estimated_complexity": "medium",
+            "should_use_hyde": False,
+            "hypothetical_docs": [],
+            "reasoning": f"Analysis failed, using original query. Error: {str(e)}"
+        }
+        return _dumps_compact(fallback)
+
+
+@tool
+def generate_hypothetical_answer(query: str) -> str:
+    """
+    [Optional - HyDE] 生成假想的理想答案文档，用于改善检索质量。
+    适用于抽象/高层次的查询。生成的文档会被用于向量检索。
+    注意：analyze_query 已经返回 hypothetical_docs 时不需要再调用本工具。
+    
+    Args:
+        query: 子查询或原始查询
+    
+    Returns:
+        假想的答案文档文本（会被 embedding 后用于检索）
+    """
+    logger.info(_BAR)
+    logger.info("🔮 [HyDE] Generating hypothetical answer document...")
+    logger.info(f"📝 Query: {query}")
+    logger.info(_BAR)
+    
+    llm = _get_agentic_llm()
+    
+    prompt = _HYDE_PROMPT.format_map({"query": query})
+    
+    cache = get_kv_cache()
+    cache_key = _llm_cache_key(llm, prompt)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info("♻️  HyDE cache hit")
+            return cached.decode("utf-8")
+    
+    try:
+        response = _invoke_tool_llm(llm, prompt)
+        content = response.content if hasattr(response, 'content') else str(response)
+        
+        logger.success(f"✅ Generated hypothetical document ({len(content)} chars)")
+        if log_enabled("INFO"):
+            logger.info(f"📄 Preview: {content[:200]}...")
+        logger.info(_BAR)
+        content = content.strip()
+        if cache is not None:
+            cache.put(cache_key, content.encode("utf-8"))
+        return content
+    except Exception as e:
+        logger.error(f"❌ HyDE generation failed: {e}")
+        logger.warning("⚠️  Falling back to original query")
+        return query  # Fallback to original query
+
+
+@tool
+def evaluate_retrieval_progress(original_query: str, retrieved_titles: List[str], round_number: int) -> str:
+    """
+    [Self-Reflection] 评估当前检索结果是否充分，决定是否需要继续检索。
+    
+    Args:
+        original_query: 用户的原始查询
+        retrieved_titles: 目前为止检索到的论文标题列表（只传标题，不要传摘要）
+        round_number: 当前是第几轮检索（1-based）
+    
+    Returns:
+        JSON格式的评估结果，包含：
+        - is_sufficient: 是否已充分
+        - coverage_score: 覆盖度评分 (0.0-1.0)
+        - missing_aspects: 缺失的方面
+        - should_continue: 是否应该继续检索
+        - next_focus: 下一步应该关注什么
+    """
+    titles_text = _titles_within_budget(retrieved_titles)
+    
+    if log_enabled("INFO"):
+        logger.info(_BAR)
+        logger.info(f"🔍 [SELF-REFLECTION] Evaluating retrieval progress - Round {round_number}")
+        logger.info(f"📝 Original Query: {original_query}")
+        logger.info(f"📊 Papers So Far: {len(retrieved_titles)}")
+        logger.info(_BAR)
+    
+    llm = _get_agentic_llm()
+    
+    prompt = _EVALUATE_PROMPT.format_map({
+        "original_query": original_query,
+        "round_number": round_number,
+        "retrieved_titles": titles_text,
+    })
+    
+    try:
+        evaluation = _stream_tool_llm_json(llm, prompt, _EVALUATE_REQUIRED_KEYS)
+        
+        logger.success(f"✅ Evaluation completed - Round {round_number}")
+        if log_enabled("INFO"):
+            coverage = evaluation.get('coverage_score')
+            coverage_text = f"{coverage:.2f}" if isinstance(coverage, (int, float)) else str(coverage)
+            logger.info(f"   📊 Coverage Score: {coverage_text}/1.0")
+            logger.info(f"   ✔️  Is Sufficient: {evaluation.get('is_sufficient')}")
+            logger.info(f"   ➡️  Should Continue: {evaluation.get('should_continue')}")
+            if evaluation.get('missing_aspects'):
+                logger.warning(f"   ⚠️  Missing Aspects: {', '.join(evaluation.get('missing_aspects', []))}")
+            if evaluation.get('next_focus'):
+                logger.info(f"   🎯 Next Focus: {evaluation.get('next_focus')}")
+            logger.info(f"   💭 Reasoning: {evaluation.get('reasoning', 'N/A')}")
+            logger.info(_BAR)
+        
+        return _dumps_compact(evaluation)
+    except Exception as e:
+        logger.error(f"❌ Evaluation failed: {e}")
+        # Fallback: stop after round 3
+        fallback = {
+            "is_sufficient": round_number >= 3,
+            "coverage_score": 0.5,
+            "missing_aspects": [],
+            "should_continue": round_number < 3,
+            "next_focus": "Continue with remaining sub-queries",
+            "reasoning": f"Evaluation failed, using heuristic. Error: {str(e)}"
+        }
+        return _dumps_compact(fallback)
+
+
+@tool
+def rerank_results(original_query: str, results_json: str) -> str:
+    """
+    [Final Step] 使用 LLM 对检索结果进行相关性评分和重排序。
+    
+    Args:
+        original_query: 用户的原始查询
+        results_json: 检索结果的 JSON 字符串（包含 title, abstract, doc_id）
+    
+    Returns:
+        重排序后的结果（JSON 格式），每个结果包含相关性分数
+    """
+    logger.info(_BAR)
+    logger.info("🏆 [PHASE 3: RERANKING] Starting LLM-based reranking...")
+    logger.info(f"📝 Query: {original_query}")
+    
+    llm = _get_agentic_llm()
+    
+    try:
+        results = json_loads(results_json)
+    except:
+        logger.error("❌ Failed to parse results JSON")
+        return results_json  # Return as-is if parsing fails
+    
+    if not results:
+        logger.warning("⚠️  No results to rerank")
+        return results_json
+    
+    logger.info(f"📊 Input: {len(results)} papers to rerank")
+    logger.info(_BAR)
+    
+    # Prepare results for LLM
+    # doc_id 不发给 LLM（按 index 回填）；空白折叠 + 截断，紧凑 JSON 编码
+    results_for_llm = []
+    for i, r in enumerate(results[:15], 1):  # Limit to top 15 for efficiency
+        # search_abstracts 的紧凑输出用 "abs"，section 结果用 "text"
+        abstract = r.get("abstract") or r.get("abs") or r.get("text") or ""
+        results_for_llm.append({
+            "index": i,
+            "title": _squash_ws(r.get("title", "Untitled"), 120),
+            "abstract": _squash_ws(abstract, 400),  # Truncate for token efficiency
+        })
+    
+    prompt = _RERANK_PROMPT.format_map({"original_query": original_query, "papers": json_dumps(results_for_llm)})
+    
+    try:
+        response = _invoke_tool_llm(llm, prompt)
+        content = response.content if hasattr(response, 'content') else str(response)
+        
+        # Apply scores to results
+        score_map = _parse_rerank_scores(content)
+        
+        for i, r in enumerate(results[:15], 1):
+            if i in score_map:
+                r["llm_relevance_score"] = score_map[i]
+            else:
+                r["llm_relevance_score"] = 5.0  # Default middle score
+        
+        # Sort by LLM score
+        reranked = sorted(results[:15], key=lambda x: x.get("llm_relevance_score", 0), reverse=True)
+        
+        # Filter out low scores (< 4.0)
+        reranked = [r for r in reranked if r.get("llm_relevance_score", 0) >= 4.0]
+        
+        logger.success(f"✅ Reranking completed!")
+        if log_enabled("INFO"):
+            logger.info(f"   📊 Final Results: {len(reranked)} papers (filtered from {len(results)})")
+            logger.info(f"   🏆 Top 5 Papers by Relevance:")
+            for i, r in enumerate(reranked[:5], 1):
+                score = r.get("llm_relevance_score", 0)
+                title = r.get("title", "Untitled")[:60]
+                logger.info(f"      {i}. [{score:.1f}/10] {title}...")
+            logger.info(_BAR)
+        
+        return _dumps_compact(reranked)
+    except Exception as e:
+        logger.error(f"❌ Reranking failed: {e}")
+        logger.warning("⚠️  Returning original results without reranking")
+        return results_json  # Return original results
+
+
+# ============== Phase 2: Abstract Search ==============
+
+@tool
+async def search_abstracts(query: str, k: int = 5, exclude_seen: bool = True) -> str:
+    """
+    [Phase 2] 搜索论文摘要，找出相关论文。
+    这是搜索的第一步，返回候选论文列表。
+    
+    Args:
+        query: 搜索关键词或自然语言查询
+        k: 返回论文数量 (默认 5)
+        exclude_seen: 排除本次检索中已经返回过的论文，只返回新论文 (默认 True)
+    
+    Returns:
+        紧凑 JSON 数组: [{"i": 序号, "doc_id", "title", "abs": 摘要预览}, ...]
+    """
+    logger.info(_BAR)
+    logger.info("🔎 [PHASE 2: RETRIEVAL] Searching abstracts...")
+    logger.info(f"📝 Query: {query}")
+    logger.info(f"📊 Requested: top {k} papers")
+    logger.info(_BAR)
+    
+    exclude = _seen_exclusion(exclude_seen)
+    results = await _cached_search_abstracts(query, k, exclude)
+    
+    if not results:
+        logger.warning("⚠️  No papers found matching the query")
+        if exclude:
+            return f"No new papers found matching the query ({len(exclude)} already returned papers excluded)."
+        return "No papers found matching the query."
+    _mark_seen(r.get("doc_id", "") for r in results)
+    
+    logger.success(f"✅ Found {len(results)} papers")
+    if log_enabled("INFO"):
+        logger.info("📄 Top 3 Results:")
+        for i, r in enumerate(results[:3], 1):
+            title = r.get('title', 'Untitled')[:60]
+            logger.info(f"   {i}. {title}... (doc_id: {r.get('doc_id', 'N/A')[:8]}...)")
+        logger.info(_BAR)
+    
+    return _dumps_compact([_abstract_entry(i, r) for i, r in enumerate(results, 1)])
+
+
+def _abstract_entry(i: int, r: dict) -> dict:
+    abstract = r.get("abstract") or ""
+    if len(abstract) > 300:
+        abstract = abstract[:300] + "..."
+    return {
+        "i": i,
+        "doc_id": r.get("doc_id", ""),
+        "title": r.get("title", "Untitled"),
+        "abs": abstract,
+    }
+
+
+@tool
+async def search_abstracts_batch(queries: List[str], k: int = 5, exclude_seen: bool = True) -> str:
+    """
+    [Phase 2 - Batch] 并发执行多个摘要检索（例如 analyze_query 给出的全部 sub_queries），
+    并按 doc_id 去重。一次调用代替多次 search_abstracts。
+    
+    Args:
+        queries: 查询列表（可直接传入 sub_queries 或 hypothetical_docs）
+        k: 每个查询返回的论文数量 (默认 5)
+        exclude_seen: 排除本次检索中之前调用已经返回过的论文 (默认 True)
+    
+    Returns:
+        紧凑 JSON 数组: [{"i", "doc_id", "title", "abs", "q": 首次命中该论文的查询序号(从 0 开始)}, ...]
+    """
+    queries = [q for q in queries if q and q.strip()]
+    if not queries:
+        return "No valid queries provided."
+    
+    logger.info(_BAR)
+    logger.info(f"🔎 [PHASE 2: RETRIEVAL] Searching abstracts for {len(queries)} queries concurrently...")
+    logger.info(_BAR)
+    
+    exclude = _seen_exclusion(exclude_seen)
+    per_query = await asyncio.gather(*(_cached_search_abstracts(q, k, exclude) for q in queries))
+    
+    seen: set[str] = set()
+    payload = []
+    for q_idx, results in enumerate(per_query):
+        for r in results:
+            doc_id = r.get("doc_id", "")
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            entry = _abstract_entry(len(payload) + 1, r)
+            entry["q"] = q_idx
+            payload.append(entry)
+    
+    if not payload:
+        logger.warning("⚠️  No papers found matching the queries")
+        if exclude:
+            return f"No new papers found matching the queries ({len(exclude)} already returned papers excluded)."
+        return "No papers found matching the queries."
+    _mark_seen(seen)
+    
+    logger.success(f"✅ Found {len(payload)} unique papers")
+    return _dumps_compact(payload)
+
+
+# ============== Phase 3: Lazy Load PDF ==============
+
+@tool
+async def load_paper_pdfs(doc_ids: List[str]) -> str:
+    """
+    [Phase 3] 加载指定论文的 PDF 内容到数据库。
+    在使用 search_paper_content 之前必须调用此工具！
+    会自动跳过已加载的论文。
+    
+    Args:
+        doc_ids: 要加载的论文 doc_id 列表（从 search_abstracts 获取）
+    
+    Returns:
+        加载状态报告
+    
+    注意：
+        - 一次建议加载 3-5 篇论文，避免等待过长
+        - 加载过程需要下载和解析 PDF，可能需要一些时间
+    """
+    # 去重并保持顺序；已知入库的论文直接标记为跳过，全部已知时完全不调用 loader
+    doc_ids = list(dict.fromkeys(doc_ids))
+    client = _get_rag_client()
+    known = _loaded_set(client)
+    to_load = [d for d in doc_ids if d not in known]
+    
+    loaded: dict[str, LoadResult] = {}
+    if to_load:
+        loader = _get_pdf_loader()
+        loaded = await asyncio.to_thread(loader.load_papers, to_load)
+        
+        # 新 chunk 入库后，之前缓存的检索结果可能已过期
+        if any(r.status == LoadStatus.SUCCESS for r in loaded.values()):
+            _invalidate_corpus_caches()
+        # 版本号因本次入库而变化；本 scope 已知的论文仍然在库里，带到新版本号下
+        _loaded_set(client).update(known, (
+            d for d, r in loaded.items()
+            if r.status in (LoadStatus.SUCCESS, LoadStatus.ALREADY_EXISTS)
+        ))
+    
+    results = {
+        d: loaded.get(d) or LoadResult(d, LoadStatus.ALREADY_EXISTS, "PDF chunks already loaded in this session")
+        for d in doc_ids
+    }
+    
+    # 格式化输出
+    output = ["PDF Loading Results:"]
+    success_count = 0
+    skip_count = 0
+    fail_count = 0
+    
+    for doc_id, result in results.items():
+        status_icon = {
+            LoadStatus.SUCCESS: "✓",
+            LoadStatus.ALREADY_EXISTS: "○",
+            LoadStatus.DOWNLOAD_FAILED: "✗",
+            LoadStatus.PARSE_FAILED: "✗",
+            LoadStatus.NO_PDF_URL: "✗",
+            LoadStatus.NOT_FOUND: "✗",
+        }.get(result.status, "?")
+        
+        output.append(f"  {status_icon} {doc_id}: {result.message}")
+        
+        if result.status == LoadStatus.SUCCESS:
+            success_count += 1
+        elif result.status == LoadStatus.ALREADY_EXISTS:
+            skip_count += 1
+        else:
+            fail_count += 1
+    
+    output.append(f"\nSummary: {success_count} loaded, {skip_count} skipped, {fail_count} failed")
+    
+    if success_count + skip_count > 0:
+        output.append("\nYou can now use search_paper_content to search within these papers.")
+    
+    return "\n".join(output)
+
+
+# ============== Phase 4: Deep Search ==============
+
+@tool  
+async def search_paper_content(query: str, doc_ids: Optional[List[str]] = None, category: int = -1, k: int = 5) -> str:
+    """
+    [Phase 4] 在已加载的论文中搜索具体内容。
+    注意：必须先用 load_paper_pdfs 加载论文！
+    
+    Args:
+        query: 搜索查询
+        doc_ids: 要搜索的论文 doc_id 列表（留空则搜索所有已加载的论文）
+        category: 章节类型过滤，-1 表示全部
+            0 = Abstract (摘要)
+            1 = Introduction (背景、动机)
+            2 = Method (技术细节、算法、架构)
+            3 = Evaluation (实验、结果、性能数据)
+            4 = Conclusion (结论)
+            6 = Related Work (注意：描述的是其他论文！)
+        k: 返回结果数量 (默认 5)
+    
+    Returns:
+        紧凑 JSON 数组: [{"i", "doc_id", "chunk_id", "section", "parent", "text"}, ...]
+    """
+    section_category = category if category >= 0 else None
+    
+    if doc_ids:
+        # 一次带 doc_id in [...] 过滤的向量检索，结果已按相关性排序
+        results = await _cached_search_by_sections_multi(query, doc_ids, section_category, k)
+    else:
+        results = await _cached_search_by_section(query, None, section_category, k)
+    
+    if not results:
+        return "No matching content found. Make sure you have loaded the papers first using load_paper_pdfs."
+    
+    return _format_section_results(results)
+
+
+def _section_results_payload(results: List[dict]) -> List[dict]:
+    payload = []
+    for i, r in enumerate(results, 1):
+        text = r.get("text") or ""
+        if len(text) > 500:
+            text = text[:500] + "..."
+        payload.append({
+            "i": i,
+            "doc_id": r.get("doc_id", ""),
+            "chunk_id": r.get("chunk_id", -1),
+            "section": SECTION_CATEGORY_NAMES.get(r.get("section_category", 0), "UNKNOWN"),
+            "parent": r.get("parent_section", ""),
+            "text": text,
+        })
+    return payload
+
+
+def _format_section_results(results: List[dict]) -> str:
+    return _dumps_compact(_section_results_payload(results))
+
+
+@tool
+async def search_paper_content_batch(queries: List[dict]) -> str:
+    """
+    [Phase 4 - Batch] 一次执行多个 search_paper_content 查询（一次数据库往返）。
+    当你计划对同一批论文做多个查询（例如不同章节类型）时，优先用这个工具。
+    注意：必须先用 load_paper_pdfs 加载论文！
+    
+    Args:
+        queries: 查询列表，每项形如
+            {"query": "...", "doc_id": "...(可选)", "category": -1, "k": 5}
+            category 含义同 search_paper_content
+    
+    Returns:
+        JSON 数组，每项为 {"query", "doc_id", "results"}，results 格式同 search_paper_content；
+        无法解析或检索失败的项为 {"error": "..."}
+    """
+    # 非法项在原位置返回 error，不影响其余查询
+    slots: list[dict | str] = []
+    requests: list[dict] = []
+    for q in queries:
+        try:
+            req = _section_request(q)
+        except (TypeError, ValueError, AttributeError) as e:
+            slots.append(f"Invalid query {q!r}: {e}")
+            continue
+        if req is not None:
+            requests.append(req)
+            slots.append(req)
+    if not slots:
+        return "No valid queries provided."
+    
+    batches: List[List[dict]] = []
+    error = None
+    if requests:
+        try:
+            batches = await asyncio.to_thread(_get_rag_client().search_by_section_batch, requests)
+        except Exception as e:
+            logger.error(f"❌ Batch content search failed: {e}")
+            error = f"Search failed: {e}"
+    
+    results_iter = iter(batches)
+    output = []
+    for slot in slots:
+        if isinstance(slot, str):
+            output.append({"error": slot})
+        elif error is not None:
+            output.append({"query": slot["query"], "doc_id": slot["doc_id"], "error": error})
+        else:
+            output.append({
+                "query": slot["query"],
+                "doc_id": slot["doc_id"],
+                "results": _section_results_payload(next(results_iter, [])),
+            })
+    return _dumps_compact(output)
+
+
+def _section_request(q: dict) -> Optional[dict]:
+    """把 LLM 给出的单个查询规范化为 search_by_section_batch 的请求；没有 query 时返回 None
+
+    category 可能是 null、"2" 之类的字符串：None 或负数表示不过滤章节
+    """
+    query = q.get("query")
+    if not query:
+        return None
+    category = q.get("category")
+    category = int(category) if category is not None else -1
+    k = q.get("k")
+    return {
+        "query": str(query),
+        "doc_id": q.get("doc_id") or None,
+        "section_category": category if category >= 0 else None,
+        "k": int(k) if k is not None else 5,
+    }
+
+
+# ============== Context Tools ==============
+
+@tool
+async def get_context_window(doc_id: str, chunk_id: int, window: int = 1) -> str:
+    """
+    获取指定 chunk 周围的上下文文本。
+    当检索到的片段不完整或被截断时使用。
+    
+    Args:
+        doc_id: 论文的 doc_id
+        chunk_id: chunk_id（从 search_paper_content 结果获取）
+        window: 前后各包含多少个 chunk (默认 1)
+    
+    Returns:
+        扩展的上下文文本
+    """
+    client = _get_rag_client()
+    return await asyncio.to_thread(
+        _context_window_impl, client, getattr(client, "collection", None), doc_id, chunk_id, window, corpus_epoch()
+    )
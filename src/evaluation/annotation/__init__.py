@@ -8,5 +8,6 @@ Annotation Module - LLM 标注
 
 from .paper_annotator import PaperAnnotator
 from .section_annotator import SectionAnnotator
+from .cache import AnnotationCache
 
-__all__ = ["PaperAnnotator", "SectionAnnotator"]
+__all__ = ["PaperAnnotator", "SectionAnnotator", "AnnotationCache"]
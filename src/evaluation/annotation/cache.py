@@ -0,0 +1,47 @@
+"""
+Annotation Cache
+
+标注结果的持久化精确匹配缓存：同一模型 + 同一 system prompt + 同一标题/摘要，
+在 temperature=0 下输出是确定的，重复运行或断点续跑时直接读盘，不再调用 LLM。
+
+底层复用 rag.kv_cache.KVCache（sqlite WAL），不引入额外依赖。
+"""
+
+from pathlib import Path
+from typing import Optional
+
+from logging_config import logger
+from rag.kv_cache import KVCache, make_key
+from utils.json_utils import json_dumps_bytes, json_loads
+
+
+class AnnotationCache:
+    """key = SHA-256(model || system prompt || title || abstract)，value = LLM 解析后的 JSON 字段"""
+
+    def __init__(self, path: Path, max_entries: int = 100000) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._kv = KVCache(str(self.path), max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_name: str, system_prompt: str, title: str, abstract: str) -> bytes:
+        return make_key(model_name, system_prompt, title, abstract)
+
+    def get(self, key: bytes) -> Optional[dict]:
+        raw = self._kv.get(key)
+        if raw is None:
+            self.misses += 1
+            return None
+        try:
+            data = json_loads(raw)
+        except ValueError:
+            logger.warning("Dropping corrupt annotation cache entry")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key: bytes, data: dict) -> None:
+        self._kv.put(key, json_dumps_bytes(data))
@@ -7,16 +7,45 @@ Paper-level Annotator
 - research_area: 研究领域
 """
 
-from typing import TYPE_CHECKING, Optional
+from typing import IO, TYPE_CHECKING, Iterable, Optional
+from dataclasses import replace
+from datetime import datetime
 from pathlib import Path
-import json
+import asyncio
+import hashlib
+import mmap
+import re
+
+try:
+    import re2  # google-re2：线性时间的 DFA 匹配
+except ModuleNotFoundError:  # pragma: no cover - fallback path
+    re2 = None
+
+try:
+    from aiolimiter import AsyncLimiter
+except ModuleNotFoundError:  # pragma: no cover - fallback path
+    AsyncLimiter = None
+
+from logging_config import logger
 
 if TYPE_CHECKING:
     from langchain_core.language_models.chat_models import BaseChatModel
 
-from evaluation.schemas import PaperAnnotation
+from evaluation.schemas import PaperAnnotation, PaperAnnotationOutput
 from evaluation.config import EvaluationConfig
 from evaluation.data_preparation import PaperSource
+from evaluation.annotation.prompts import PAPER_ANNOTATION_SYSTEM, build_paper_annotation_prompt, count_tokens
+from evaluation.annotation.cache import AnnotationCache
+from langchain.chat_models import init_chat_model
+from models import cacheable_system_message, structured_output_llm
+from utils import extract_text_from_message_content
+from utils.async_utils import run_sync
+from utils.json_utils import RAW_DOC_ID_PATTERN, decode_json_string, json_dumps_bytes, json_loads, parse_llm_json
+
+# 在原始字节上定位 JSONL 记录里的字段，不必解析整条记录；装了 re2 时用 re2
+_regex = re2 if re2 is not None else re
+_DOC_ID_RE = _regex.compile(RAW_DOC_ID_PATTERN)
+_CONTENT_HASH_RE = _regex.compile(rb'"content_hash"\s*:\s*"([0-9a-f]*)"')
 
 
 class PaperAnnotator:
@@ -25,17 +54,66 @@ class PaperAnnotator:
     def __init__(
         self, 
         llm_client: "BaseChatModel",
-        config: Optional[EvaluationConfig] = None
+        config: Optional[EvaluationConfig] = None,
+        concurrency: int = 8,
+        use_cache: bool = True
     ):
         """
         Args:
             llm_client: LLM 客户端，用于生成标注
             config: 评估配置
+            concurrency: 同时在途的 LLM 请求数上限
+            use_cache: 是否使用持久化的标注结果缓存（config.annotation_cache_file）
         """
-        self.llm = llm_client
         self.config = config or EvaluationConfig()
         self.config.ensure_dirs()
+        self.concurrency = concurrency
+        self.llm = llm_client
+        self._fallback_annotator = None
+        self._fallback_system_message: Optional[dict] = None
+        self._fallback_model_name: Optional[str] = None
+        if self.config.annotation_model:
+            # 短 JSON 输出用小模型（量化/蒸馏版本）跑，大模型只处理解析失败的论文
+            self.llm = self._init_annotation_model(self.config)
+            self._fallback_annotator = structured_output_llm(llm_client, PaperAnnotationOutput) or llm_client
+            # system 消息的形状（是否带 cache_control）取决于 provider，按兜底模型单独构建
+            self._fallback_system_message = cacheable_system_message(llm_client, PAPER_ANNOTATION_SYSTEM)
+            self._fallback_model_name = self._model_name_of(llm_client)
+        # 所有论文共用同一条 system 消息，只有 user 消息（标题 + 摘要）不同
+        self._system_message = cacheable_system_message(self.llm, PAPER_ANNOTATION_SYSTEM)
+        # JSON mode 保证输出可直接解析；模型不支持时退回解析文本
+        self._annotator = structured_output_llm(self.llm, PaperAnnotationOutput) or self.llm
+        self._rpm, self._tpm = self._init_limiters(self.config)
+        self.cache = AnnotationCache(self.config.annotation_cache_file) if use_cache else None
+        # 追加写入 summaries_file 的句柄，首次 append 时打开
+        self._fh: Optional[IO[bytes]] = None
+        # 本进程内加载过或产出过的标注，按 doc_id 查找，命中时不再读盘或查缓存
+        self._mem: dict[str, PaperAnnotation] = {}
+        self._model_name = self._model_name_of(self.llm)
+    
+    @staticmethod
+    def _model_name_of(llm) -> str:
+        return str(getattr(llm, "model_name", None) or getattr(llm, "model", "") or type(llm).__name__)
         
+    @staticmethod
+    def _init_limiters(config: EvaluationConfig) -> tuple[Optional["AsyncLimiter"], Optional["AsyncLimiter"]]:
+        """按 provider 配额构建令牌桶；未配置或未安装 aiolimiter 时不限流"""
+        if not (config.annotation_rpm or config.annotation_tpm):
+            return None, None
+        if AsyncLimiter is None:
+            logger.warning("annotation_rpm/annotation_tpm set but aiolimiter is not installed; rate limiting disabled")
+            return None, None
+        rpm = AsyncLimiter(config.annotation_rpm, 60) if config.annotation_rpm else None
+        tpm = AsyncLimiter(config.annotation_tpm, 60) if config.annotation_tpm else None
+        return rpm, tpm
+    
+    @staticmethod
+    def _init_annotation_model(config: EvaluationConfig) -> "BaseChatModel":
+        kwargs = {"temperature": 0}
+        if config.annotation_model.startswith("ollama:"):
+            kwargs["base_url"] = config.llm_base_url
+        return init_chat_model(config.annotation_model, **kwargs)
+    
     def annotate_single(self, paper: PaperSource) -> PaperAnnotation:
         """
         标注单篇论文
@@ -46,12 +124,99 @@ class PaperAnnotator:
         Returns:
             PaperAnnotation 对象
         """
-        # TODO: 实现
-        # 1. 构建 prompt (使用 title + abstract)
-        # 2. 调用 LLM
-        # 3. 解析 JSON 输出
-        # 4. 返回 PaperAnnotation
-        raise NotImplementedError
+        hit = self._from_mem(paper) or self._from_cache(paper)
+        if hit is not None:
+            return hit
+        response = self._annotator.invoke(self._build_prompt(paper))
+        annotation = self._to_annotation(paper, response)
+        self._mem[paper.doc_id] = annotation
+        return annotation
+    
+    async def aannotate_single(self, paper: PaperSource) -> PaperAnnotation:
+        """annotate_single 的异步版本"""
+        hit = self._from_mem(paper) or self._from_cache(paper)
+        if hit is not None:
+            return hit
+        response = await self._annotator.ainvoke(self._build_prompt(paper))
+        annotation = self._to_annotation(paper, response)
+        self._mem[paper.doc_id] = annotation
+        return annotation
+    
+    def _from_mem(self, paper: PaperSource) -> Optional[PaperAnnotation]:
+        """内存命中仅在标题 + 摘要未变时有效；内容变了的论文需要重新标注"""
+        hit = self._mem.get(paper.doc_id)
+        if hit is not None and hit.content_hash == self._content_hash(paper):
+            return hit
+        return None
+    
+    def _build_prompt(self, paper: PaperSource, system_message: Optional[dict] = None) -> list[dict]:
+        return build_paper_annotation_prompt(paper.title, paper.abstract, system_message or self._system_message)
+    
+    def _cache_key(self, paper: PaperSource, model_name: Optional[str] = None) -> bytes:
+        return AnnotationCache.make_key(
+            model_name or self._model_name, PAPER_ANNOTATION_SYSTEM, paper.title, paper.abstract
+        )
+    
+    def _from_cache(self, paper: PaperSource) -> Optional[PaperAnnotation]:
+        """先查小模型的缓存，再查兜底模型（小模型曾解析失败的论文）的缓存"""
+        if self.cache is None:
+            return None
+        for model_name in (self._model_name, self._fallback_model_name):
+            if model_name is None:
+                continue
+            data = self.cache.get(self._cache_key(paper, model_name))
+            if data is not None:
+                return self._build_annotation(paper, data)
+        return None
+    
+    def _to_annotation(self, paper: PaperSource, response, model_name: Optional[str] = None) -> PaperAnnotation:
+        """从 LLM 输出组装 PaperAnnotation；解析成功的结果按产出它的模型写入缓存"""
+        if isinstance(response, PaperAnnotationOutput):
+            data = response.model_dump()
+        else:
+            content = extract_text_from_message_content(getattr(response, "content", response))
+            data = parse_llm_json(content)
+            if not isinstance(data, dict):
+                raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+        if self.cache is not None:
+            self.cache.put(self._cache_key(paper, model_name), data)
+        return self._build_annotation(paper, data)
+    
+    def _build_annotation(self, paper: PaperSource, data: dict) -> PaperAnnotation:
+        return PaperAnnotation(
+            doc_id=paper.doc_id,
+            title=paper.title,
+            conference=paper.conference_name,
+            year=paper.conference_year,
+            summary=data.get("summary", ""),
+            keywords=list(data.get("keywords", [])),
+            research_area=data.get("research_area", ""),
+            annotated_at=datetime.now().isoformat(),
+            content_hash=self._content_hash(paper),
+        )
+    
+    @staticmethod
+    def _content_hash(paper: PaperSource) -> str:
+        """(title, abstract) 的摘要；跨会议重复收录的同一篇论文得到相同的 hash"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(paper.title.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(paper.abstract.encode("utf-8"))
+        return h.hexdigest()
+    
+    @staticmethod
+    def _copy_for(paper: PaperSource, annotation: PaperAnnotation) -> PaperAnnotation:
+        """把同内容论文的标注复制给另一个 doc_id"""
+        return replace(
+            annotation,
+            doc_id=paper.doc_id,
+            title=paper.title,
+            conference=paper.conference_name,
+            year=paper.conference_year,
+            keywords=list(annotation.keywords),
+            method_keywords=list(annotation.method_keywords),
+            eval_keywords=list(annotation.eval_keywords),
+        )
     
     def annotate_all(
         self, 
@@ -62,6 +227,8 @@ class PaperAnnotator:
         """
         批量标注所有论文
         
+        同步入口，在共享的常驻事件循环上执行 aannotate_all；已在事件循环中时请直接 await aannotate_all。
+        
         Args:
             papers: 论文列表
             batch_size: 批量大小（控制进度保存频率）
@@ -70,26 +237,234 @@ class PaperAnnotator:
         Returns:
             PaperAnnotation 列表
         """
-        # TODO: 实现
-        # 1. 如果 resume=True，加载已有标注，跳过已处理的
-        # 2. 批量调用 annotate_single
-        # 3. 定期保存到 config.summaries_file
-        raise NotImplementedError
+        return run_sync(self.aannotate_all(papers, batch_size=batch_size, resume=resume))
     
-    def load_existing(self) -> dict[str, PaperAnnotation]:
+    async def aannotate_all(
+        self,
+        papers: list[PaperSource],
+        batch_size: int = 10,
+        resume: bool = True
+    ) -> list[PaperAnnotation]:
+        """
+        分批标注所有论文：每批 batch_size 篇通过一次 llm.abatch 发出
+        （provider 支持时走原生批量接口，否则由 LangChain 以 max_concurrency 并发），
+        每批完成后追加保存。标题 + 摘要完全相同的论文只标注一次。
+        """
+        # 先只扫描 doc_id 决定跳过哪些论文，再只解析本次需要的记录：
+        # 请求中已标注的论文，以及与待标注论文内容 hash 相同的记录
+        done_ids = self.loaded_ids() if resume else set()
+        todo = [p for p in papers if p.doc_id not in done_ids]
+        # 已在内存中的记录不必再从文件解析
+        existing = self.load_existing(
+            doc_ids=[p.doc_id for p in papers if p.doc_id in done_ids and p.doc_id not in self._mem],
+            content_hashes=[self._content_hash(p) for p in todo],
+        ) if done_ids else {}
+        for p in papers:
+            if p.doc_id in done_ids and p.doc_id in self._mem:
+                existing[p.doc_id] = self._mem[p.doc_id]
+        logger.info(f"Annotating {len(todo)} papers ({len(papers) - len(todo)} already annotated)")
+        
+        annotated: dict[str, PaperAnnotation] = dict(existing)
+        # 已有标注按内容 hash 索引，内容重复的新 doc_id 直接复用
+        by_hash = {a.content_hash: a for a in (*self._mem.values(), *existing.values()) if a.content_hash}
+        
+        # 内容相同的论文只发一次 LLM 请求，结果分发给组内所有 doc_id
+        groups: dict[str, list[PaperSource]] = {}
+        reused = 0
+        for p in todo:
+            h = self._content_hash(p)
+            source = by_hash.get(h)
+            if source is None and h not in groups:
+                source = self._from_cache(p)
+                if source is not None:
+                    by_hash[h] = source
+            if source is None:
+                groups.setdefault(h, []).append(p)
+                continue
+            annotation = source if source.doc_id == p.doc_id else self._copy_for(p, source)
+            annotated[p.doc_id] = annotation
+            self.append(annotation)
+            reused += 1
+        if reused:
+            self.flush()
+            logger.info(f"Reused {reused} annotations from cache or identical papers")
+        
+        leaders = [group[0] for group in groups.values()]
+        failed = 0
+        new = 0
+        for start in range(0, len(leaders), batch_size):
+            chunk = leaders[start:start + batch_size]
+            responses = await self._abatch(self._annotator, chunk)
+            results = [self._try_annotation(p, r) for p, r in zip(chunk, responses)]
+            
+            retry = [i for i, r in enumerate(results) if isinstance(r, Exception)]
+            if retry and self._fallback_annotator is not None:
+                logger.info(f"Retrying {len(retry)} papers with the fallback model")
+                fallback_responses = await self._abatch(
+                    self._fallback_annotator, [chunk[i] for i in retry], self._fallback_system_message
+                )
+                for i, response in zip(retry, fallback_responses):
+                    results[i] = self._try_annotation(chunk[i], response, self._fallback_model_name)
+            
+            for paper, annotation in zip(chunk, results):
+                group = groups[self._content_hash(paper)]
+                if isinstance(annotation, Exception):
+                    failed += len(group)
+                    logger.warning(f"Annotation failed for {paper.doc_id}: {annotation}")
+                    continue
+                for member in group:
+                    member_annotation = annotation if member is paper else self._copy_for(member, annotation)
+                    annotated[member.doc_id] = member_annotation
+                    self.append(member_annotation)
+                new += len(group)
+            
+            # 只在批次边界落盘
+            self.flush()
+            logger.info(f"Annotated {min(start + batch_size, len(leaders))}/{len(leaders)} unique papers")
+        
+        logger.info(
+            f"Annotation finished: {new} new ({len(leaders)} LLM calls), {reused} reused, {failed} failed"
+        )
+        return [annotated[p.doc_id] for p in papers if p.doc_id in annotated]
+    
+    async def _abatch(self, annotator, papers: list[PaperSource], system_message: Optional[dict] = None) -> list:
+        prompts = [self._build_prompt(p, system_message) for p in papers]
+        if self._rpm is None and self._tpm is None:
+            return await annotator.abatch(
+                prompts,
+                config={"max_concurrency": min(self.concurrency, len(papers))},
+                return_exceptions=True,
+            )
+        
+        # 配置了配额时逐个请求过令牌桶，按配额匀速发出，避免 429 退避把整批拖慢
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def call(prompt: list[dict]):
+            async with semaphore:
+                await self._acquire_quota(prompt)
+                return await annotator.ainvoke(prompt)
+        
+        return await asyncio.gather(*(call(p) for p in prompts), return_exceptions=True)
+    
+    async def _acquire_quota(self, prompt: list[dict]) -> None:
+        if self._rpm is not None:
+            await self._rpm.acquire()
+        if self._tpm is not None:
+            tokens = sum(count_tokens(m["content"]) for m in prompt if isinstance(m.get("content"), str))
+            # 单次申请不能超过桶容量
+            await self._tpm.acquire(min(tokens, self._tpm.max_rate))
+    
+    def _try_annotation(
+        self, paper: PaperSource, response, model_name: Optional[str] = None
+    ) -> PaperAnnotation | Exception:
+        try:
+            if isinstance(response, BaseException):
+                raise response
+            return self._to_annotation(paper, response, model_name)
+        except Exception as e:
+            return e
+    
+    def loaded_ids(self) -> set[str]:
+        """
+        已标注论文的 doc_id 集合
+
+        只用正则在 mmap 的原始字节上扫描 doc_id 字段，不解析 JSON、不逐条构造对象，
+        适合断点续跑时只需要判断“是否已标注”的场景。
+        """
+        path = self.config.summaries_file
+        if not path.exists() or path.stat().st_size == 0:
+            return set()
+        # mmap 读取的是磁盘上的内容，先把缓冲区写出
+        self.flush()
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # stdlib re 可以直接扫描 mmap；re2 只接受 bytes
+            data = mm if re2 is None else mm[:]
+            return {decode_json_string(m.group(1)) for m in _DOC_ID_RE.finditer(data)}
+    
+    def load_existing(
+        self,
+        doc_ids: Optional[Iterable[str]] = None,
+        content_hashes: Optional[Iterable[str]] = None
+    ) -> dict[str, PaperAnnotation]:
         """
         加载已有的标注结果
         
+        Args:
+            doc_ids / content_hashes: 都为 None 时加载全部；否则只解析 doc_id 或 content_hash
+                命中其中之一的记录，其余行只做一次正则匹配
+        
         Returns:
             {doc_id: PaperAnnotation}
         """
-        # TODO: 实现
-        raise NotImplementedError
+        path = self.config.summaries_file
+        if not path.exists():
+            return {}
+        
+        wanted_ids = set(doc_ids or ())
+        wanted_hashes = {h.encode("ascii") for h in content_hashes or ()}
+        select = doc_ids is not None or content_hashes is not None
+        
+        # 未落盘的追加内容先写出，保证读到的是完整文件
+        self.flush()
+        existing: dict[str, PaperAnnotation] = {}
+        with open(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if select and not self._line_selected(line, wanted_ids, wanted_hashes):
+                    continue
+                try:
+                    annotation = PaperAnnotation.from_record(json_loads(line))
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Skipping malformed annotation line: {e}")
+                    continue
+                # 同一 doc_id 出现多次时以最后一次为准
+                existing[annotation.doc_id] = annotation
+        self._mem.update(existing)
+        return existing
+    
+    @staticmethod
+    def _line_selected(line: bytes, wanted_ids: set[str], wanted_hashes: set[bytes]) -> bool:
+        if wanted_hashes:
+            m = _CONTENT_HASH_RE.search(line)
+            if m and m.group(1) in wanted_hashes:
+                return True
+        if wanted_ids:
+            m = _DOC_ID_RE.search(line)
+            if m and decode_json_string(m.group(1)) in wanted_ids:
+                return True
+        return False
+    
+    def append(self, annotation: PaperAnnotation) -> None:
+        """追加一条标注到 JSONL 文件（写入缓冲区，flush() 时落盘）"""
+        if self._fh is None:
+            path = self.config.summaries_file
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._fh = open(path, "ab", buffering=1 << 20)
+        self._fh.write(json_dumps_bytes(annotation.to_record()) + b"\n")
+        self._mem[annotation.doc_id] = annotation
+    
+    def flush(self) -> None:
+        if self._fh is not None:
+            self._fh.flush()
+    
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+    
+    def __enter__(self) -> "PaperAnnotator":
+        return self
+    
+    def __exit__(self, *exc) -> None:
+        self.close()
     
     def save(self, annotations: list[PaperAnnotation]) -> None:
-        """保存标注结果到 JSONL 文件"""
-        # TODO: 实现
-        raise NotImplementedError
+        """追加保存一组标注结果并立即落盘"""
+        for annotation in annotations:
+            self.append(annotation)
+        self.flush()
     
     def get_stats(self, annotations: list[PaperAnnotation]) -> dict:
         """
@@ -102,5 +477,13 @@ class PaperAnnotator:
                 "avg_keywords": 4.2
             }
         """
-        # TODO: 实现
-        raise NotImplementedError
+        by_area: dict[str, int] = {}
+        for a in annotations:
+            area = a.research_area or "unknown"
+            by_area[area] = by_area.get(area, 0) + 1
+        total = len(annotations)
+        return {
+            "total": total,
+            "by_research_area": by_area,
+            "avg_keywords": sum(len(a.keywords) for a in annotations) / total if total else 0.0,
+        }
@@ -1,16 +1,64 @@
 """
 标注用的 Prompt 模板
+
+每个模板拆成两部分：固定不变的 system 指令（含输出 JSON 格式），和只包含论文内容的 user 消息。
+这样同一类标注的所有请求共享同一前缀，provider 侧的前缀缓存可以命中。
+
+Section-level 标注反过来：论文上下文在前、任务说明在后，同一篇论文的两次调用共享前缀。
 """
 
+from functools import lru_cache
+from typing import Any, Optional
+
+try:
+    import tiktoken
+except ModuleNotFoundError:  # pragma: no cover - fallback path
+    tiktoken = None
+
+# section 正文的 token 上限；没有 tiktoken 时按 ~4 字符/token 换算成字符上限
+SECTION_MAX_TOKENS = 768
+_CHARS_PER_TOKEN = 4
+_TRUNCATED_MARK = "\n... [truncated]"
+
+
+@lru_cache(maxsize=1)
+def _encoder():
+    """惰性加载 tokenizer（o200k_base，与 GPT-4o 系列一致）；不可用时返回 None"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """估算 text 的 token 数（用于限流）；没有 tiktoken 时按字符数换算"""
+    enc = _encoder()
+    if enc is None:
+        return len(text) // _CHARS_PER_TOKEN + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=1024)
+def _truncate_tokens(content: str, max_tokens: int = SECTION_MAX_TOKENS) -> str:
+    """按 token 截断正文；同一 section 在批量运行中重复出现时直接命中缓存"""
+    enc = _encoder()
+    if enc is None:
+        max_chars = max_tokens * _CHARS_PER_TOKEN
+        if len(content) > max_chars:
+            return content[:max_chars] + _TRUNCATED_MARK
+        return content
+    tokens = enc.encode(content, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return content
+    return enc.decode(tokens[:max_tokens]) + _TRUNCATED_MARK
+
 # ============== Paper-level 标注 ==============
 
-PAPER_ANNOTATION_PROMPT = """
+PAPER_ANNOTATION_SYSTEM = """
 You are an academic paper analyzer. Given a paper's title and abstract, generate a structured annotation.
 
-# Input
-Title: {title}
-Abstract: {abstract}
-
 # Task
 Generate the following in JSON format:
 1. summary: A 1-2 sentence summary of the paper's core contribution (in English)
@@ -18,24 +66,37 @@ Generate the following in JSON format:
 3. research_area: The primary research area (choose from: security, privacy, systems, networking, ML/AI, software engineering, other)
 
 # Output Format (JSON only, no markdown)
-{{
+{
   "summary": "...",
   "keywords": ["...", "...", "..."],
   "research_area": "..."
-}}
+}
+"""
+
+PAPER_ANNOTATION_USER_TEMPLATE = """# Input
+Title: {title}
+Abstract: {abstract}
 """
 
 
 # ============== Section-level 标注 ==============
+# 同一篇论文的 Method 和 Evaluation 标注共用同一段上下文（标题 + 两个 section 正文），
+# 放在 system 消息里作为可缓存前缀；两类任务说明只作为末尾较短的 user 消息。
+# 这样每篇论文的第二次调用可以命中 provider 侧的前缀缓存。
 
-METHOD_ANNOTATION_PROMPT = """
-You are an academic paper analyzer. Given the Method/Design section of a paper, generate a structured summary.
+SECTION_CONTEXT_TEMPLATE = """You are an academic paper analyzer. Below are sections of a paper; answer the task that follows.
 
 # Paper Title
 {title}
+"""
 
-# Method Section Content
+SECTION_CONTEXT_BLOCK_TEMPLATE = """
+# {heading} Section Content
 {content}
+"""
+
+METHOD_ANNOTATION_TASK = """
+Summarize the Method/Design section of the paper above.
 
 # Task
 Generate the following in JSON format:
@@ -43,21 +104,14 @@ Generate the following in JSON format:
 2. keywords: 3-5 key technical terms specific to the method (in English)
 
 # Output Format (JSON only, no markdown)
-{{
+{
   "summary": "...",
   "keywords": ["...", "...", "..."]
-}}
+}
 """
 
-
-EVALUATION_ANNOTATION_PROMPT = """
-You are an academic paper analyzer. Given the Evaluation/Experiment section of a paper, generate a structured summary.
-
-# Paper Title
-{title}
-
-# Evaluation Section Content
-{content}
+EVALUATION_ANNOTATION_TASK = """
+Summarize the Evaluation/Experiment section of the paper above.
 
 # Task
 Generate the following in JSON format:
@@ -65,32 +119,52 @@ Generate the following in JSON format:
 2. keywords: 3-5 key terms related to the evaluation (metrics, datasets, baselines, etc.)
 
 # Output Format (JSON only, no markdown)
-{{
+{
   "summary": "...",
   "keywords": ["...", "...", "..."]
-}}
+}
 """
 
 
 # ============== 辅助函数 ==============
 
-def build_paper_annotation_prompt(title: str, abstract: str) -> str:
-    """构建 Paper-level 标注 prompt"""
-    return PAPER_ANNOTATION_PROMPT.format(title=title, abstract=abstract)
+Messages = list[dict[str, Any]]
+
+
+def _messages(system: str | dict[str, Any], user: str) -> Messages:
+    # system 可以是预先构建好的 message（例如带 cache_control 的 Anthropic block）
+    system_message = system if isinstance(system, dict) else {"role": "system", "content": system}
+    return [system_message, {"role": "user", "content": user}]
+
+
+def build_paper_annotation_prompt(
+    title: str, abstract: str, system_message: Optional[dict[str, Any]] = None
+) -> Messages:
+    """构建 Paper-level 标注 prompt（system + user 消息）"""
+    user = PAPER_ANNOTATION_USER_TEMPLATE.format(title=title, abstract=abstract)
+    return _messages(system_message or PAPER_ANNOTATION_SYSTEM, user)
+
+
+def build_section_context(title: str, method_content: str = "", evaluation_content: str = "") -> str:
+    """构建论文的 section 上下文（各 section 按 token 截断，空 section 省略）"""
+    context = SECTION_CONTEXT_TEMPLATE.format(title=title)
+    for heading, content in (("Method", method_content), ("Evaluation", evaluation_content)):
+        if content:
+            context += SECTION_CONTEXT_BLOCK_TEMPLATE.format(heading=heading, content=_truncate_tokens(content))
+    return context
 
 
-def build_method_annotation_prompt(title: str, content: str) -> str:
-    """构建 Method section 标注 prompt"""
-    # 截断过长内容
-    max_length = 3000
-    if len(content) > max_length:
-        content = content[:max_length] + "\n... [truncated]"
-    return METHOD_ANNOTATION_PROMPT.format(title=title, content=content)
+def build_method_annotation_prompt(
+    title: str, content: str = "", context_message: Optional[dict[str, Any]] = None
+) -> Messages:
+    """构建 Method section 标注 prompt；传入 context_message 时与 Evaluation 标注共用上下文前缀"""
+    return _messages(context_message or build_section_context(title, method_content=content), METHOD_ANNOTATION_TASK)
 
 
-def build_evaluation_annotation_prompt(title: str, content: str) -> str:
-    """构建 Evaluation section 标注 prompt"""
-    max_length = 3000
-    if len(content) > max_length:
-        content = content[:max_length] + "\n... [truncated]"
-    return EVALUATION_ANNOTATION_PROMPT.format(title=title, content=content)
+def build_evaluation_annotation_prompt(
+    title: str, content: str = "", context_message: Optional[dict[str, Any]] = None
+) -> Messages:
+    """构建 Evaluation section 标注 prompt；传入 context_message 时与 Method 标注共用上下文前缀"""
+    return _messages(
+        context_message or build_section_context(title, evaluation_content=content), EVALUATION_ANNOTATION_TASK
+    )
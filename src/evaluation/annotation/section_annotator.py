@@ -4,27 +4,39 @@ Section-level Annotator
 负责为已加载 PDF 的论文生成:
 - method_summary: 方法总结
 - method_keywords: 方法关键词
-- eval_summary: 评估总结  
+- eval_summary: 评估总结
 - eval_keywords: 评估关键词
 """
 
-from typing import TYPE_CHECKING
+from typing import IO, TYPE_CHECKING, Optional
 from pathlib import Path
+import asyncio
+
+from logging_config import logger
 
 if TYPE_CHECKING:
     from rag.retriever import RAG
     from langchain_core.language_models.chat_models import BaseChatModel
 
-from evaluation.schemas import PaperAnnotation
+from evaluation.schemas import PaperAnnotation, SectionAnnotationOutput
+from evaluation.annotation.prompts import (
+    build_section_context,
+    build_method_annotation_prompt,
+    build_evaluation_annotation_prompt,
+)
+from models import cacheable_system_message, structured_output_llm
+from utils import extract_text_from_message_content
+from utils.async_utils import run_sync
+from utils.json_utils import json_dumps_bytes, json_loads, parse_llm_json
 
 
 class SectionAnnotator:
     """Section-level 标注器"""
-    
+
     # Section category 映射
     SECTION_CATEGORY_METHOD = 2      # Method/Design
     SECTION_CATEGORY_EVALUATION = 3  # Evaluation/Experiment
-    
+
     def __init__(
         self,
         rag_client: "RAG",
@@ -40,32 +52,83 @@ class SectionAnnotator:
         self.rag_client = rag_client
         self.llm = llm_client
         self.index_path = Path(index_path)
-    
+        # JSON mode 保证输出可直接解析；模型不支持时退回解析文本
+        self._annotator = structured_output_llm(self.llm, SectionAnnotationOutput) or self.llm
+
     def annotate_section(
-        self, 
-        doc_id: str, 
-        section_category: int
+        self,
+        doc_id: str,
+        section_category: int,
+        title: str = ""
     ) -> tuple[str, list[str]]:
         """
         标注单个 section
-        
+
         Args:
             doc_id: 论文 ID
             section_category: section 类型 (2=Method, 3=Evaluation)
-            
+            title: 论文标题（放进 prompt 作为上下文）
+
         Returns:
-            (summary, keywords) 元组
+            (summary, keywords) 元组；该 section 没有 chunk 时返回 ("", [])
         """
-        # TODO: 实现
-        # 1. 从 RAG 获取该 section 的所有 chunks
-        # 2. 拼接 chunks 文本
-        # 3. 调用 LLM 生成 summary 和 keywords
-        raise NotImplementedError
-    
-    def annotate_paper_sections(self, doc_id: str) -> dict:
+        content = self._section_text(doc_id, section_category)
+        if not content:
+            return "", []
+        context = self._context_message(title, section_category, content)
+        response = self._annotator.invoke(self._build_prompt(section_category, context))
+        return self._parse_response(response)
+
+    async def aannotate_section(
+        self,
+        doc_id: str,
+        section_category: int,
+        title: str = ""
+    ) -> tuple[str, list[str]]:
+        """annotate_section 的异步版本"""
+        content = await asyncio.to_thread(self._section_text, doc_id, section_category)
+        if not content:
+            return "", []
+        context = self._context_message(title, section_category, content)
+        return await self._ainvoke_section(section_category, context)
+
+    def _section_text(self, doc_id: str, section_category: int) -> str:
+        return "\n\n".join(self.get_section_chunks(doc_id, section_category))
+
+    def _context_message(self, title: str, section_category: int, content: str) -> dict:
+        if section_category == self.SECTION_CATEGORY_METHOD:
+            context = build_section_context(title, method_content=content)
+        else:
+            context = build_section_context(title, evaluation_content=content)
+        return cacheable_system_message(self.llm, context)
+
+    def _build_prompt(self, section_category: int, context_message: dict) -> list[dict]:
+        if section_category == self.SECTION_CATEGORY_METHOD:
+            return build_method_annotation_prompt("", context_message=context_message)
+        return build_evaluation_annotation_prompt("", context_message=context_message)
+
+    async def _ainvoke_section(self, section_category: int, context_message: dict) -> tuple[str, list[str]]:
+        response = await self._annotator.ainvoke(self._build_prompt(section_category, context_message))
+        return self._parse_response(response)
+
+    @staticmethod
+    def _parse_response(response) -> tuple[str, list[str]]:
+        if isinstance(response, SectionAnnotationOutput):
+            return response.summary, list(response.keywords)
+        content = extract_text_from_message_content(getattr(response, "content", response))
+        data = parse_llm_json(content)
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+        return data.get("summary", ""), list(data.get("keywords", []))
+
+    def annotate_paper_sections(self, doc_id: str, title: str = "") -> dict:
         """
         标注单篇论文的 Method 和 Evaluation sections
-        
+
+        两个 section 相互独立，并发请求，耗时取两者的较大值而不是之和。
+        两次请求共用同一条上下文 system 消息（标题 + 两个 section 正文），只有末尾的任务说明不同，
+        provider 侧的前缀缓存可以在同一篇论文内复用。
+
         Returns:
             {
                 "method_summary": str,
@@ -74,26 +137,110 @@ class SectionAnnotator:
                 "eval_keywords": list
             }
         """
-        # TODO: 实现
-        raise NotImplementedError
-    
+        return run_sync(self.aannotate_paper_sections(doc_id, title))
+
+    async def aannotate_paper_sections(self, doc_id: str, title: str = "") -> dict:
+        """annotate_paper_sections 的异步版本"""
+        method_text, eval_text = await asyncio.gather(
+            asyncio.to_thread(self._section_text, doc_id, self.SECTION_CATEGORY_METHOD),
+            asyncio.to_thread(self._section_text, doc_id, self.SECTION_CATEGORY_EVALUATION),
+        )
+        context = cacheable_system_message(self.llm, build_section_context(title, method_text, eval_text))
+
+        async def annotate(section_category: int, content: str) -> tuple[str, list[str]]:
+            if not content:
+                return "", []
+            return await self._ainvoke_section(section_category, context)
+
+        (method_summary, method_keywords), (eval_summary, eval_keywords) = await asyncio.gather(
+            annotate(self.SECTION_CATEGORY_METHOD, method_text),
+            annotate(self.SECTION_CATEGORY_EVALUATION, eval_text),
+        )
+        return {
+            "method_summary": method_summary,
+            "method_keywords": method_keywords,
+            "eval_summary": eval_summary,
+            "eval_keywords": eval_keywords,
+        }
+
     def annotate_loaded_papers(self, batch_size: int = 10) -> int:
         """
         标注所有已加载 PDF 的论文
-        
-        只处理 has_pdf_loaded=True 且尚未有 section 标注的论文
-        
+
+        只处理 has_pdf_loaded=True 且尚未有 section 标注的论文。
+        同步入口，在共享的常驻事件循环上执行 aannotate_loaded_papers。
+
         Returns:
             标注的论文数量
         """
-        # TODO: 实现
-        # 1. 读取 papers_index.jsonl
-        # 2. 筛选需要标注的论文
-        # 3. 批量标注
-        # 4. 更新并保存
-        raise NotImplementedError
-    
+        return run_sync(self.aannotate_loaded_papers(batch_size=batch_size))
+
+    async def aannotate_loaded_papers(self, batch_size: int = 10) -> int:
+        """annotate_loaded_papers 的异步版本；最多 batch_size 篇论文同时在途"""
+        papers = self.load_index()
+        todo = [a for a in papers.values() if a.method_summary is None and await self._pdf_loaded(a)]
+        logger.info(f"Section-annotating {len(todo)} papers ({len(papers)} in index)")
+
+        semaphore = asyncio.Semaphore(batch_size)
+
+        async def annotate(annotation: PaperAnnotation) -> Optional[PaperAnnotation]:
+            async with semaphore:
+                try:
+                    sections = await self.aannotate_paper_sections(annotation.doc_id, annotation.title)
+                except Exception as e:
+                    logger.warning(f"Section annotation failed for {annotation.doc_id}: {e}")
+                    return None
+            for key, value in sections.items():
+                setattr(annotation, key, value)
+            annotation.has_pdf_loaded = True
+            return annotation
+
+        done = 0
+        fh: Optional[IO[bytes]] = None
+        try:
+            for coro in asyncio.as_completed([annotate(a) for a in todo]):
+                annotation = await coro
+                if annotation is None:
+                    continue
+                if fh is None:
+                    self.index_path.parent.mkdir(parents=True, exist_ok=True)
+                    fh = open(self.index_path, "ab")
+                # 追加更新后的记录；读取时同一 doc_id 以最后一条为准
+                fh.write(json_dumps_bytes(annotation.to_record()) + b"\n")
+                done += 1
+                if done % batch_size == 0:
+                    fh.flush()
+                    logger.info(f"Section-annotated {done}/{len(todo)} papers")
+        finally:
+            if fh is not None:
+                fh.close()
+
+        logger.info(f"Section annotation finished: {done} annotated, {len(todo) - done} failed")
+        return done
+
+    async def _pdf_loaded(self, annotation: PaperAnnotation) -> bool:
+        if annotation.has_pdf_loaded:
+            return True
+        return await asyncio.to_thread(self.rag_client.check_pdf_chunks_exist, annotation.doc_id)
+
+    def load_index(self) -> dict[str, PaperAnnotation]:
+        """读取 index_path，返回 {doc_id: PaperAnnotation}（同一 doc_id 以最后一条为准）"""
+        if not self.index_path.exists():
+            return {}
+        index: dict[str, PaperAnnotation] = {}
+        with open(self.index_path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    annotation = PaperAnnotation.from_record(json_loads(line))
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Skipping malformed annotation line: {e}")
+                    continue
+                index[annotation.doc_id] = annotation
+        return index
+
     def get_section_chunks(self, doc_id: str, section_category: int) -> list[str]:
         """从 RAG 获取指定 section 的所有 chunks 文本"""
-        # TODO: 实现
-        raise NotImplementedError
+        return self.rag_client.get_section_chunks(doc_id, section_category)
@@ -2,23 +2,29 @@
 对比实验运行器
 
 自动化运行所有配置组合的评估实验:
-- 2 种 Chunk 策略 (paragraph, contextual)
-- 3 种 Index 类型 (FLAT, HNSW, IVF)
+- Chunk 策略 (默认 paragraph, contextual)
+- Index 类型 (FLAT, HNSW, IVF)；auto_select_indexes 时按各策略的向量数裁剪，
+  小规模只跑 FLAT，HNSW 还可按 hnsw_ef_values 扫描搜索 ef
 - 2 种 RAG 模式 (basic, agentic)
 
-总计: 2 × 3 × 2 = 12 种配置
+完整矩阵为 2 × 3 × 2 = 12 种配置，实际数量见 EvaluationConfig.get_all_experiments
 """
 
-from typing import TYPE_CHECKING, Optional
-from dataclasses import dataclass, field, asdict
+from typing import TYPE_CHECKING, Iterator, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import cached_property
 from pathlib import Path
 from datetime import datetime
-import json
+import multiprocessing
 
 from logging_config import logger
+from settings import settings
+from utils.json_utils import json_dumps_bytes, json_loads
 
 if TYPE_CHECKING:
     from langchain_core.language_models.chat_models import BaseChatModel
+    from rag.milvus import MilvusProvider
 
 from evaluation.config import (
     EvaluationConfig, ExperimentConfig, 
@@ -26,7 +32,7 @@ from evaluation.config import (
 )
 from evaluation.schemas import EvaluationReport, L1Result, L2Result, L3Result
 from evaluation.runner import EvaluationRunner
-from evaluation.data_preparation.collection_builder import CollectionBuilder
+from evaluation.data_preparation.collection_builder import CollectionBuilder, search_params_for
 from evaluation.data_preparation.pipeline import DataPreparationPipeline
 
 
@@ -36,7 +42,9 @@ class ExperimentResult:
     config: ExperimentConfig
     report: EvaluationReport
     
-    def to_dict(self) -> dict:
+    @cached_property
+    def as_dict(self) -> dict:
+        """汇总字典只算一次；结果构造完成后不再修改，缓存是安全的"""
         return {
             "config": {
                 "name": self.config.name,
@@ -56,9 +64,12 @@ class ExperimentResult:
                 "l3_faithfulness": self.report.l3_end_to_end.faithfulness,
             }
         }
+    
+    def to_dict(self) -> dict:
+        return self.as_dict
 
 
-@dataclass
+@dataclass(slots=True)
 class ComparisonReport:
     """对比实验汇总报告"""
     run_id: str
@@ -71,9 +82,26 @@ class ComparisonReport:
             "run_id": self.run_id,
             "run_at": self.run_at,
             "total_experiments": self.total_experiments,
-            "results": [r.to_dict() for r in self.results]
+            "results": [r.as_dict for r in self.results]
         }
     
+    def iter_json_bytes(self) -> Iterator[bytes]:
+        """
+        逐个结果编码 JSON，不先构造整棵 to_dict() 树
+
+        输出与 to_dict() 等价：头部字段一次写出，results 每个实验一行。
+        """
+        header = json_dumps_bytes({
+            "run_id": self.run_id,
+            "run_at": self.run_at,
+            "total_experiments": self.total_experiments,
+        })
+        # 去掉头部对象的 "}"，接上 results 数组
+        yield header[:-1] + b',"results":['
+        for i, r in enumerate(self.results):
+            yield (b",\n" if i else b"\n") + json_dumps_bytes(r.as_dict)
+        yield b"\n]}\n"
+    
     def to_markdown_table(self) -> str:
         """生成 Markdown 对比表格"""
         headers = [
@@ -83,7 +111,7 @@ class ComparisonReport:
         
         rows = []
         for r in self.results:
-            m = r.to_dict()["metrics"]
+            m = r.as_dict["metrics"]
             rows.append([
                 r.config.name,
                 r.config.chunk_strategy.value,
@@ -121,20 +149,12 @@ class AgenticRAGAdapter:
         """
         self.base_rag = base_rag_client
         self.llm = llm_client
-        self._searcher = None
     
-    @property
+    @cached_property
     def searcher(self):
-        """延迟初始化 Searcher"""
-        if self._searcher is None:
-            from agents.searcher import Searcher
-            from settings import settings
-            # 临时启用 agentic 模式
-            original = settings.enable_agentic_rag
-            settings.enable_agentic_rag = True
-            self._searcher = Searcher()
-            settings.enable_agentic_rag = original
-        return self._searcher
+        """延迟初始化 Searcher；agentic 模式通过参数指定，不修改全局 settings"""
+        from agents.searcher import Searcher
+        return Searcher(enable_agentic=True)
     
     def search_abstracts(self, query: str, k: int = 10) -> list[dict]:
         """
@@ -158,47 +178,129 @@ class AgenticRAGAdapter:
         return getattr(self.base_rag, name)
 
 
+def _run_experiments_in_worker(
+    config: EvaluationConfig,
+    experiments: list[ExperimentConfig],
+    run_l3: bool,
+    llm_usage: Optional[str],
+    force_rebuild: bool,
+) -> list[tuple[ExperimentConfig, Optional["ExperimentResult"]]]:
+    """
+    子进程入口：串行运行共用同一个 collection 的一组实验
+
+    LLM 客户端无法跨进程传递，在子进程内按 usage 重新创建。
+    """
+    llm = None
+    if llm_usage:
+        from models import get_llm_by_usage
+        llm = get_llm_by_usage(llm_usage)
+    # 缓存日志只由父进程读写；子进程若也加载/压缩它，会与父进程的追加写入竞争
+    runner = ComparisonRunner(llm, config, force_rebuild=force_rebuild, use_cache=False)
+    results = []
+    for exp in experiments:
+        try:
+            results.append((exp, runner.run_single_experiment(exp, run_l3=run_l3)))
+        except Exception:
+            logger.exception(f"Experiment {exp.name} failed")
+            results.append((exp, None))
+    return results
+
+
 class ComparisonRunner:
     """对比实验运行器"""
     
     def __init__(
         self,
         llm_client: Optional["BaseChatModel"] = None,
-        config: Optional[EvaluationConfig] = None
+        config: Optional[EvaluationConfig] = None,
+        max_workers: int = 1,
+        worker_llm_usage: str = "evaluation",
+        force_rebuild: bool = False,
+        run_id: Optional[str] = None,
+        use_cache: bool = True
     ):
+        """
+        Args:
+            llm_client: LLM 客户端（max_workers=1 时直接使用）
+            config: 评估配置
+            max_workers: 并行进程数；共用 collection 的实验（同一 chunk 策略）在同一进程内串行
+            worker_llm_usage: 并行时子进程通过 get_llm_by_usage(worker_llm_usage) 创建 LLM
+            force_rebuild: 每个实验都重新从 chunks 文件导入；默认只在 chunks 变化后导入
+            run_id: 本次对比运行的 ID；为空时在 run_all_experiments 中生成
+            use_cache: 是否读写 .comparison_cache.jsonl；并行子进程传 False，日志只由父进程维护
+        """
         self.config = config or EvaluationConfig()
+        self.config.ensure_dirs()
         self.llm = llm_client
         self.builder = CollectionBuilder(self.config)
+        self.max_workers = max_workers
+        self.worker_llm_usage = worker_llm_usage
+        self.force_rebuild = force_rebuild
+        self.run_id = run_id
+        self.run_at: Optional[str] = None
         
-        # 缓存文件路径
-        self._cache_file = self.config.reports_dir / ".comparison_cache.json"
+        # 缓存：追加写入的 JSONL 日志 + 内存索引（同一实验以最后一条为准）
+        self._cache_file = self.config.reports_dir / ".comparison_cache.jsonl"
+        self.use_cache = use_cache
+        self._cache: dict[str, dict] = self._load_cache() if use_cache else {}
+        # ground truth 问题的 query embedding；所有实验共用同一份 QA，只需批量算一次
+        self._query_embeddings: dict[str, list[float]] = {}
+    
+    @cached_property
+    def _source_provider(self) -> "MilvusProvider":
+        """业务库客户端，整个 runner 生命周期内只建立一次连接"""
+        from rag.milvus import MilvusProvider
+        return MilvusProvider()
+    
+    @cached_property
+    def _eval_provider(self) -> "MilvusProvider":
+        """评估库客户端；各实验通过 use_collection 切换 collection，复用连接和 embedding 客户端"""
+        from rag.milvus import MilvusProvider
+        return MilvusProvider()
     
     def _load_cache(self) -> dict[str, dict]:
-        """加载已完成实验的缓存"""
+        """启动时扫描一次缓存日志；重复记录过多时顺便压缩"""
         if not self._cache_file.exists():
             return {}
-        try:
-            with open(self._cache_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            logger.warning(f"Failed to load cache: {e}")
-            return {}
+        cache: dict[str, dict] = {}
+        lines = 0
+        with open(self._cache_file, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                lines += 1
+                try:
+                    record = json_loads(line)
+                    cache[record["exp_name"]] = record["result"]
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Skipping malformed cache line: {e}")
+        if lines > 2 * len(cache):
+            self._compact_cache(cache)
+        return cache
     
-    def _save_cache(self, cache: dict[str, dict]) -> None:
-        """保存缓存"""
-        self._cache_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(self._cache_file, "w", encoding="utf-8") as f:
-            json.dump(cache, f, ensure_ascii=False, indent=2)
+    def _compact_cache(self, cache: dict[str, dict]) -> None:
+        """把日志重写为每个实验一条记录（写临时文件后原子替换）"""
+        tmp = self._cache_file.with_suffix(".jsonl.tmp")
+        with open(tmp, "wb") as f:
+            for name, result in cache.items():
+                f.write(json_dumps_bytes({"exp_name": name, "result": result}) + b"\n")
+        tmp.replace(self._cache_file)
     
     def _cache_result(self, exp_name: str, result: ExperimentResult) -> None:
-        """缓存单个实验结果"""
-        cache = self._load_cache()
-        cache[exp_name] = result.to_dict()
-        self._save_cache(cache)
+        """缓存单个实验结果：更新内存索引并追加一行，不重写整个文件"""
+        data = result.as_dict
+        self._cache[exp_name] = data
+        if not self.use_cache:
+            return
+        self._cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._cache_file, "ab") as f:
+            f.write(json_dumps_bytes({"exp_name": exp_name, "result": data}) + b"\n")
         logger.info(f"  ✓ Cached: {exp_name}")
     
     def clear_cache(self) -> None:
         """清除缓存"""
+        self._cache.clear()
         if self._cache_file.exists():
             self._cache_file.unlink()
             logger.info("Cache cleared")
@@ -218,13 +320,10 @@ class ComparisonRunner:
         Returns:
             每种策略的处理结果
         """
-        from rag.milvus import MilvusProvider
-        
         strategies = strategies or self.config.chunk_strategies
-        source_rag = MilvusProvider()
         
         pipeline = DataPreparationPipeline(
-            source_rag_client=source_rag,
+            source_rag_client=self._source_provider,
             llm_client=self.llm,
             config=self.config
         )
@@ -256,28 +355,31 @@ class ComparisonRunner:
         Returns:
             ExperimentResult
         """
-        from rag.milvus import MilvusProvider
+        from rag.feature_extractor import embedding_scope
         
         logger.info(f"Running experiment: {experiment.name}")
         
-        # 1. 重建 collection（使用指定的索引类型）
-        self.builder.create_collection(
-            chunk_strategy=experiment.chunk_strategy,
-            index_type=experiment.index_type,
-            drop_if_exists=True
-        )
-        
-        # 2. 从 chunks 文件重建数据
+        # 1. 准备该 chunk 策略的 collection：chunks 有变化时才重新导入，否则只按需切换 index
         pipeline = DataPreparationPipeline(
-            source_rag_client=MilvusProvider(),  # 业务库
+            source_rag_client=self._source_provider,  # 业务库
             llm_client=self.llm,
             config=self.config
         )
-        pipeline.rebuild_from_chunks(experiment.chunk_strategy)
+        pipeline.rebuild_from_chunks(
+            experiment.chunk_strategy,
+            index_type=experiment.index_type,
+            collection_name=experiment.collection_name,
+            eval_rag_client=self._eval_provider,
+            force=self.force_rebuild,
+            index_params=experiment.index_params or None,
+        )
         
-        # 3. 切换到评估 collection 并运行评估
-        with self.builder.use_chunk_strategy(experiment.chunk_strategy):
-            milvus = MilvusProvider()
+        # 2. 切换到评估 collection 并运行评估
+        with self.builder.use_chunk_strategy(experiment.chunk_strategy, experiment.collection_name) as eval_collection:
+            milvus = self._eval_provider
+            milvus.use_collection(eval_collection)
+            # 搜索参数按实验设置（eval provider 在实验间复用，每次都要覆盖）
+            milvus.search_params = search_params_for(experiment.index_type, experiment.search_params)
             
             # 根据是否 agentic 选择 RAG 客户端
             if experiment.enable_agentic_rag:
@@ -292,11 +394,21 @@ class ComparisonRunner:
                 config=self.config
             )
             
-            # 运行评估
-            report = runner.run_all()
+            # 运行评估；问题的 embedding 提前批量算好，检索时直接命中
+            ground_truth = runner.load_ground_truth()
+            self._prime_query_embeddings(milvus, [qa.question for qa in ground_truth.qa_pairs])
+            with embedding_scope(self._query_embeddings):
+                report = runner.run_all(ground_truth)
         
         return ExperimentResult(config=experiment, report=report)
     
+    def _prime_query_embeddings(self, milvus: "MilvusProvider", questions: list[str]) -> None:
+        """批量计算尚未缓存的问题 embedding（embedding 模型在各实验间不变）"""
+        missing = [q for q in questions if q not in self._query_embeddings]
+        if missing:
+            self._query_embeddings.update(milvus.embedding_client.embed_queries(missing))
+            logger.info(f"Pre-embedded {len(missing)} evaluation queries")
+    
     def run_all_experiments(
         self,
         experiments: list[ExperimentConfig] = None,
@@ -318,10 +430,16 @@ class ComparisonRunner:
         """
         import uuid
         
+        # run_id / run_at 只生成一次，日志、JSON、Markdown 使用同一个时间戳
+        self.run_id = self.run_id or uuid.uuid4().hex[:8]
+        self.run_at = datetime.now().isoformat(timespec="seconds")
+        
         experiments = experiments or self.config.get_all_experiments()
         
+        logger.info(f"Comparison run {self.run_id} started at {self.run_at}")
+        
         # 加载缓存
-        cache = self._load_cache() if resume else {}
+        cache = self._cache if resume else {}
         cached_count = len([e for e in experiments if e.name in cache])
         
         logger.info(f"Running {len(experiments)} experiments")
@@ -337,53 +455,86 @@ class ComparisonRunner:
             logger.info("Preparing data for all chunk strategies...")
             self.prepare_data(strategies=list(strategies_needed))
         
-        # 运行每个实验
-        results = []
-        for i, exp in enumerate(experiments, 1):
-            logger.info(f"\n{'='*60}")
-            logger.info(f"Experiment {i}/{len(experiments)}: {exp.name}")
-            logger.info(f"{'='*60}")
-            
-            # 检查缓存
+        # 先恢复已缓存的实验
+        results: dict[str, ExperimentResult] = {}
+        pending: list[ExperimentConfig] = []
+        for exp in experiments:
             if resume and exp.name in cache:
-                logger.info(f"  ⏭️  Skipped (cached)")
-                # 从缓存恢复结果
                 cached_data = cache[exp.name]
                 result = self._restore_from_cache(exp, cached_data)
                 if result:
-                    results.append(result)
+                    results[exp.name] = result
                     m = cached_data["metrics"]
-                    logger.info(f"  (Cached) MRR={m['l1_mrr']:.3f}, HitRate={m['l1_hit_rate']:.3f}, "
-                               f"L3_Acc={m['l3_accuracy']:.3f}")
+                    logger.info(f"  ⏭️  Skipped (cached) {exp.name}: MRR={m['l1_mrr']:.3f}, "
+                               f"HitRate={m['l1_hit_rate']:.3f}, L3_Acc={m['l3_accuracy']:.3f}")
                 continue
-            
-            try:
-                result = self.run_single_experiment(exp, run_l3=run_l3)
-                results.append(result)
-                
-                # 缓存结果
-                self._cache_result(exp.name, result)
-                
-                # 打印中间结果
-                m = result.to_dict()["metrics"]
-                logger.info(f"  MRR={m['l1_mrr']:.3f}, HitRate={m['l1_hit_rate']:.3f}, "
-                           f"L3_Acc={m['l3_accuracy']:.3f}")
-            except Exception as e:
-                logger.error(f"Experiment {exp.name} failed: {e}")
-                import traceback
-                traceback.print_exc()
+            pending.append(exp)
+        
+        # 运行剩余实验；每完成一个就缓存并打印
+        for i, (exp, result) in enumerate(self._run_pending(pending, run_l3), 1):
+            logger.info(f"Experiment {i}/{len(pending)} finished: {exp.name}")
+            if result is None:
                 continue
+            results[exp.name] = result
+            self._cache_result(exp.name, result)
+            m = result.as_dict["metrics"]
+            logger.info(f"  MRR={m['l1_mrr']:.3f}, HitRate={m['l1_hit_rate']:.3f}, "
+                       f"L3_Acc={m['l3_accuracy']:.3f}")
         
         # 生成汇总报告
         comparison = ComparisonReport(
-            run_id=str(uuid.uuid4())[:8],
-            run_at=datetime.now().isoformat(),
+            run_id=self.run_id,
+            run_at=self.run_at,
             total_experiments=len(experiments),
-            results=results
+            results=[results[e.name] for e in experiments if e.name in results]
         )
         
         return comparison
     
+    def _parallel_workers(self, n_groups: int) -> int:
+        """Milvus Lite（本地文件）不支持多进程同时访问，此时退回串行"""
+        if self.max_workers <= 1 or n_groups <= 1:
+            return 1
+        if not settings.milvus_uri.startswith(("http://", "https://", "tcp://")):
+            logger.warning("Milvus Lite does not support concurrent processes; running experiments sequentially")
+            return 1
+        return min(self.max_workers, n_groups)
+    
+    def _run_pending(self, pending: list[ExperimentConfig], run_l3: bool):
+        """按完成顺序产出 (experiment, result)；失败的实验 result 为 None"""
+        # 同一 collection 上的实验会切换 index，必须串行，按 collection 分组后组间并行
+        groups: dict[str, list[ExperimentConfig]] = {}
+        for exp in pending:
+            groups.setdefault(exp.collection_name, []).append(exp)
+        workers = self._parallel_workers(len(groups))
+        if workers == 1:
+            for exp in pending:
+                logger.info(f"\n{'='*60}")
+                logger.info(f"Experiment: {exp.name}")
+                logger.info(f"{'='*60}")
+                try:
+                    yield exp, self.run_single_experiment(exp, run_l3=run_l3)
+                except Exception:
+                    logger.exception(f"Experiment {exp.name} failed")
+                    yield exp, None
+            return
+        
+        logger.info(f"Running {len(pending)} experiments ({len(groups)} collections) in {workers} worker processes")
+        llm_usage = self.worker_llm_usage if self.llm is not None else None
+        # spawn：避免 fork 继承 gRPC/线程状态
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {
+                pool.submit(_run_experiments_in_worker, self.config, exps, run_l3, llm_usage, self.force_rebuild): exps
+                for exps in groups.values()
+            }
+            for future in as_completed(futures):
+                try:
+                    yield from future.result()
+                except Exception as e:
+                    for exp in futures[future]:
+                        logger.error(f"Experiment {exp.name} failed: {e}")
+                        yield exp, None
+    
     def _restore_from_cache(
         self, 
         exp: ExperimentConfig, 
@@ -433,12 +584,13 @@ class ComparisonRunner:
     
     def save_comparison(self, comparison: ComparisonReport) -> Path:
         """保存对比报告"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 文件名时间戳取自 run_at，与报告内容一致
+        timestamp = datetime.fromisoformat(comparison.run_at).strftime("%Y%m%d_%H%M%S")
         filename = f"comparison_{comparison.run_id}_{timestamp}.json"
         output_path = self.config.reports_dir / filename
         
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(comparison.to_dict(), f, ensure_ascii=False, indent=2)
+        with open(output_path, "wb") as f:
+            f.writelines(comparison.iter_json_bytes())
         
         # 同时保存 Markdown 表格
         md_path = output_path.with_suffix(".md")
@@ -7,7 +7,19 @@ Evaluation 配置
 from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
+import os
+import threading
+
+from logging_config import logger
+from utils.json_utils import json_loads
+
+# 本进程内已确认存在的 data_dir；同一目录只做一次 mkdir
+_ensured_data_dirs: set[Path] = set()
+_ensured_data_dirs_lock = threading.Lock()
+
+# vector_count 没有构建标记时，抽样解析的 chunks 文件数
+_VECTOR_COUNT_SAMPLE_SIZE = 20
 
 
 class ChunkStrategy(str, Enum):
@@ -30,10 +42,19 @@ class ExperimentConfig:
     chunk_strategy: ChunkStrategy
     index_type: IndexType
     enable_agentic_rag: bool = False
+    # 覆盖默认的 index 构建参数（如 HNSW 的 M/efConstruction）
+    index_params: dict = field(default_factory=dict)
+    # 覆盖默认的搜索参数（如 HNSW 的 ef），只影响查询，不需要重建 index
+    search_params: dict = field(default_factory=dict)
     
     @property
     def collection_name(self) -> str:
-        """生成 collection 名称 (只按 chunk 策略分)"""
+        """
+        生成 collection 名称
+
+        同一 chunk 策略的实验共用一个 collection：index 类型不同只需重建 index，
+        agentic 与否不影响 collection，向量只 embedding/插入一次
+        """
         return f"papers_eval_{self.chunk_strategy.value}"
     
     @property
@@ -65,11 +86,39 @@ class EvaluationConfig:
         """分块缓存目录"""
         return self.data_dir / "chunks"
     
+    def chunk_file(self, strategy: ChunkStrategy, doc_id: str) -> Path:
+        """单篇论文的 chunks 文件；按 doc_id 前两位分子目录，避免单个目录里堆上万个文件"""
+        return self.chunks_dir / strategy.value / doc_id[:2] / f"{doc_id}.json"
+    
+    def iter_chunk_files(self, strategy: ChunkStrategy) -> Iterator[Path]:
+        """遍历某个策略下的所有 chunks 文件（兼容旧的扁平布局）；os.scandir 复用目录项类型，不逐个 stat"""
+        root = self.chunks_dir / strategy.value
+        if not root.is_dir():
+            return
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    with os.scandir(entry.path) as shard:
+                        for sub in shard:
+                            if sub.name.endswith(".json") and sub.is_file():
+                                yield Path(sub.path)
+                elif entry.name.endswith(".json") and entry.is_file():
+                    yield Path(entry.path)
+    
+    def collection_marker_file(self, collection_name: str) -> Path:
+        """记录 collection 由哪一版 chunks 文件构建（以及向量数）的标记文件"""
+        return self.data_dir / "collections" / f"{collection_name}.json"
+    
     @property
     def summaries_file(self) -> Path:
         """论文标注结果"""
         return self.data_dir / "papers_summaries.jsonl"
     
+    @property
+    def annotation_cache_file(self) -> Path:
+        """LLM 标注结果缓存（sqlite）"""
+        return self.data_dir / "annotation_cache.db"
+    
     @property
     def ground_truth_file(self) -> Path:
         """Ground Truth QA pairs"""
@@ -94,14 +143,27 @@ class EvaluationConfig:
     index_types: list[IndexType] = field(
         default_factory=lambda: [IndexType.FLAT, IndexType.HNSW, IndexType.IVF]
     )
+    # 按向量数（collection 行数）裁剪 index_types：小规模时 HNSW/IVF 与 FLAT 的召回几乎一致，
+    # 延迟差异在亚毫秒级（IVF 甚至可能更慢），扫这些配置只是浪费时间。False 时总是跑全部 index_types
+    auto_select_indexes: bool = True
+    # HNSW 实验额外扫描的搜索 ef（如 [16, 32, 64, 128]），共用同一个 index，用于画召回-延迟曲线；空则只用默认 ef
+    hnsw_ef_values: list[int] = field(default_factory=list)
     
     # === Embedding 配置 ===
     embedding_model: str = "qwen3-embedding:4b"
     embedding_dim: int = 2560
+    # 重建评估 collection 时并发导入的论文数（embedding 与 insert 都是网络 I/O）
+    insert_workers: int = 4
     
     # === LLM 配置 (用于 Contextual Chunking 和标注) ===
     llm_model: str = "qwen3:8b"  # 本地 Ollama 模型
     llm_base_url: str = "http://localhost:11434"
+    # 批量标注用的小模型（"provider:model"，如 "ollama:qwen2.5:7b-instruct-q8_0"、"openai:gpt-4o-mini"）；
+    # None 时直接使用传入的 llm_client，设置后 llm_client 只在小模型输出解析失败时兜底
+    annotation_model: Optional[str] = None
+    # provider 配额（每分钟请求数 / token 数）；None 表示不限流，只受 concurrency 约束
+    annotation_rpm: Optional[int] = None
+    annotation_tpm: Optional[int] = None
     
     # === QA 生成配置 ===
     num_qa_pairs: int = 100
@@ -112,19 +174,90 @@ class EvaluationConfig:
     # === 评估配置 ===
     top_k_values: list[int] = field(default_factory=lambda: [5, 10])
     
-    def get_all_experiments(self) -> list[ExperimentConfig]:
-        """生成所有实验配置组合"""
+    def effective_index_types(self, n_vectors: Optional[int]) -> list[IndexType]:
+        """
+        按向量数挑选值得对比的 index 类型（index 的代价取决于向量数，即 chunk 数，而不是论文数）
+
+        - < 10 万: 只跑 FLAT
+        - 10 万 ~ 100 万: FLAT + HNSW
+        - > 100 万 或规模未知: 全部 index_types
+        """
+        if not self.auto_select_indexes or n_vectors is None:
+            return list(self.index_types)
+        if n_vectors < 100_000:
+            wanted = {IndexType.FLAT}
+        elif n_vectors < 1_000_000:
+            wanted = {IndexType.FLAT, IndexType.HNSW}
+        else:
+            return list(self.index_types)
+        selected = [it for it in self.index_types if it in wanted]
+        # 用户没配置 FLAT 等情况下不裁剪，避免一个实验都不剩
+        return selected or list(self.index_types)
+
+    def vector_count(self, strategy: ChunkStrategy) -> Optional[int]:
+        """
+        估算某个策略的评估 collection 会有多少向量：每篇论文一条 paper-level 记录 + 全部 chunks
+
+        只用于挑选 index 类型，不需要精确值：
+        优先读 collection 构建完成时标记文件里记录的行数；否则按 chunks 文件数 × 抽样文件的平均 chunk 数估算。
+        还没有 chunks 文件（数据未准备）时返回 None
+        """
+        marker = self.collection_marker_file(f"papers_eval_{strategy.value}")
+        if marker.exists():
+            try:
+                recorded = json_loads(marker.read_bytes()).get("n_vectors")
+                if isinstance(recorded, int):
+                    return recorded
+            except (OSError, ValueError, AttributeError) as e:
+                logger.warning(f"Ignoring unreadable collection marker {marker}: {e}")
+
+        paths = list(self.iter_chunk_files(strategy))
+        if not paths:
+            return None
+        # 等间隔抽样，只解析少量文件
+        step = max(1, len(paths) // _VECTOR_COUNT_SAMPLE_SIZE)
+        sampled = []
+        for path in paths[::step][:_VECTOR_COUNT_SAMPLE_SIZE]:
+            try:
+                sampled.append(len(json_loads(path.read_bytes()).get("chunks", [])))
+            except (OSError, ValueError, AttributeError) as e:
+                logger.warning(f"Skipping unreadable chunks file {path}: {e}")
+        avg_chunks = sum(sampled) / len(sampled) if sampled else 0
+        return round(len(paths) * (1 + avg_chunks))
+
+    def get_all_experiments(self, n_vectors: Optional[int] = None) -> list[ExperimentConfig]:
+        """
+        生成所有实验配置组合
+
+        Args:
+            n_vectors: 向量数，用于裁剪 index 类型；None 时按各策略的 chunks 文件分别统计
+        """
         experiments = []
         for chunk in self.chunk_strategies:
-            for index in self.index_types:
-                for agentic in [False, True]:
-                    exp = ExperimentConfig(
-                        name=f"{chunk.value}_{index.value.lower()}_{'agentic' if agentic else 'basic'}",
-                        chunk_strategy=chunk,
-                        index_type=index,
-                        enable_agentic_rag=agentic
-                    )
-                    experiments.append(exp)
+            chunk_vectors = n_vectors
+            if chunk_vectors is None and self.auto_select_indexes:
+                chunk_vectors = self.vector_count(chunk)
+            index_types = self.effective_index_types(chunk_vectors)
+            skipped = [it.value for it in self.index_types if it not in index_types]
+            if skipped:
+                logger.info(
+                    f"[{chunk.value}] {chunk_vectors} vectors: skipping index types {skipped} "
+                    f"(indistinguishable from FLAT at this scale; set auto_select_indexes=False to run them)"
+                )
+            for index in index_types:
+                # 只有 HNSW 扫描 ef；None 表示使用默认搜索参数
+                ef_values = self.hnsw_ef_values if index == IndexType.HNSW and self.hnsw_ef_values else [None]
+                for ef in ef_values:
+                    ef_suffix = f"_ef{ef}" if ef is not None else ""
+                    for agentic in [False, True]:
+                        exp = ExperimentConfig(
+                            name=f"{chunk.value}_{index.value.lower()}{ef_suffix}_{'agentic' if agentic else 'basic'}",
+                            chunk_strategy=chunk,
+                            index_type=index,
+                            enable_agentic_rag=agentic,
+                            search_params={"ef": ef} if ef is not None else {},
+                        )
+                        experiments.append(exp)
         return experiments
     
     def get_collections(self) -> list[str]:
@@ -132,13 +265,21 @@ class EvaluationConfig:
         return [f"papers_eval_{chunk.value}" for chunk in self.chunk_strategies]
     
     def ensure_dirs(self) -> None:
-        """确保所有目录存在"""
-        self.data_dir.mkdir(parents=True, exist_ok=True)
-        self.pdf_dir.mkdir(parents=True, exist_ok=True)
-        self.chunks_dir.mkdir(parents=True, exist_ok=True)
-        (self.chunks_dir / "paragraph").mkdir(exist_ok=True)
-        (self.chunks_dir / "contextual").mkdir(exist_ok=True)
-        self.reports_dir.mkdir(parents=True, exist_ok=True)
+        """确保所有目录存在（每个进程、每个 data_dir 只执行一次）"""
+        if self.data_dir in _ensured_data_dirs:
+            return
+        with _ensured_data_dirs_lock:
+            if self.data_dir in _ensured_data_dirs:
+                return
+            # makedirs 会顺带创建 data_dir / chunks_dir 等父目录
+            for path in (
+                self.pdf_dir,
+                self.chunks_dir / ChunkStrategy.PARAGRAPH.value,
+                self.chunks_dir / ChunkStrategy.CONTEXTUAL.value,
+                self.reports_dir,
+            ):
+                os.makedirs(path, exist_ok=True)
+            _ensured_data_dirs.add(self.data_dir)
 
 
 # 默认配置单例
@@ -10,11 +10,15 @@ Collection Builder
 from typing import TYPE_CHECKING, Optional
 from dataclasses import dataclass
 from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import math
 
 from pymilvus import MilvusClient
 
 from logging_config import logger
 from settings import settings
+from utils.json_utils import json_dumps_bytes, json_loads
 
 if TYPE_CHECKING:
     from rag.milvus import MilvusProvider
@@ -23,6 +27,7 @@ from evaluation.config import EvaluationConfig, ChunkStrategy, IndexType
 
 
 # Index 参数配置
+# HNSW: M 超过 16 后构建代价成倍增加，召回几乎不再提升；efConstruction 128 对论文规模的语料足够
 INDEX_PARAMS = {
     IndexType.FLAT: {
         "index_type": "FLAT",
@@ -30,7 +35,7 @@ INDEX_PARAMS = {
     },
     IndexType.HNSW: {
         "index_type": "HNSW",
-        "params": {"M": 16, "efConstruction": 256}
+        "params": {"M": 16, "efConstruction": 128}
     },
     IndexType.IVF: {
         "index_type": "IVF_FLAT",
@@ -38,6 +43,7 @@ INDEX_PARAMS = {
     },
 }
 
+# 搜索时参数，不需要重建 index，可按实验覆盖（如扫描 HNSW 的 ef）
 SEARCH_PARAMS = {
     IndexType.FLAT: {},
     IndexType.HNSW: {"ef": 64},
@@ -45,6 +51,25 @@ SEARCH_PARAMS = {
 }
 
 
+def index_params_for(
+    index_type: IndexType,
+    n_vectors: Optional[int] = None,
+    overrides: Optional[dict] = None
+) -> dict:
+    """index 构建参数：默认值；IVF 已知数据量时 nlist 取 sqrt(n)；最后叠加实验指定的覆盖值"""
+    params = dict(INDEX_PARAMS.get(index_type, INDEX_PARAMS[IndexType.FLAT])["params"])
+    if index_type == IndexType.IVF and n_vectors:
+        params["nlist"] = max(1, min(65536, int(math.sqrt(n_vectors))))
+    if overrides:
+        params.update(overrides)
+    return params
+
+
+def search_params_for(index_type: IndexType, overrides: Optional[dict] = None) -> dict:
+    """搜索参数：按 index 类型的默认值，叠加实验指定的覆盖值"""
+    return {**SEARCH_PARAMS.get(index_type, {}), **(overrides or {})}
+
+
 @dataclass
 class CollectionStats:
     """Collection 统计信息"""
@@ -67,17 +92,12 @@ class CollectionBuilder:
             config: 评估配置
         """
         self.config = config or EvaluationConfig()
-        self._client: Optional[MilvusClient] = None
     
     @property
     def client(self) -> MilvusClient:
-        """获取 Milvus 客户端（延迟创建）"""
-        if self._client is None:
-            self._client = MilvusClient(
-                uri=settings.milvus_uri,
-                token=settings.milvus_token
-            )
-        return self._client
+        """获取 Milvus 客户端（进程内按 uri/token 共享，与 MilvusProvider 复用同一连接）"""
+        from rag.milvus import get_milvus_client
+        return get_milvus_client(settings.milvus_uri, settings.milvus_token)
     
     def _get_collection_name(self, chunk_strategy: ChunkStrategy) -> str:
         """生成 collection 名称"""
@@ -89,7 +109,9 @@ class CollectionBuilder:
         self,
         chunk_strategy: ChunkStrategy,
         index_type: IndexType = IndexType.FLAT,
-        drop_if_exists: bool = False
+        drop_if_exists: bool = False,
+        collection_name: Optional[str] = None,
+        index_params: Optional[dict] = None
     ) -> str:
         """
         创建 evaluation collection
@@ -97,22 +119,25 @@ class CollectionBuilder:
         使用与业务库相同的 schema
         
         Args:
-            chunk_strategy: 分块策略（决定 collection 名称）
+            chunk_strategy: 分块策略（决定默认 collection 名称）
             index_type: 索引类型
             drop_if_exists: 是否删除已存在的 collection
+            collection_name: 指定 collection 名称（如单个实验专用的 collection）
+            index_params: 覆盖默认的 index 构建参数
             
         Returns:
             collection 名称
         """
         from rag.milvus import MilvusProvider
         
-        collection_name = self._get_collection_name(chunk_strategy)
+        collection_name = collection_name or self._get_collection_name(chunk_strategy)
         
         # 检查是否存在
         if self.client.has_collection(collection_name):
             if drop_if_exists:
                 logger.info(f"Dropping existing collection: {collection_name}")
                 self.client.drop_collection(collection_name)
+                self._marker_path(collection_name).unlink(missing_ok=True)
             else:
                 logger.info(f"Collection already exists: {collection_name}")
                 return collection_name
@@ -121,22 +146,11 @@ class CollectionBuilder:
         provider = MilvusProvider()
         schema = provider._create_schema()
         
-        # 创建 index params
-        index_config = INDEX_PARAMS.get(index_type, INDEX_PARAMS[IndexType.FLAT])
-        index_params = self.client.prepare_index_params()
-        index_params.add_index(
-            field_name=settings.milvus_vector_field,
-            index_type=index_config["index_type"],
-            metric_type=settings.milvus_vector_index_metric_type,
-            index_name="vector_index",
-            params=index_config["params"],
-        )
-        
-        # 创建 collection
+        # 创建 collection（此时还没有数据，IVF 用默认 nlist）
         self.client.create_collection(
             collection_name=collection_name,
             schema=schema,
-            index_params=index_params,
+            index_params=self._vector_index_params(index_type, index_params_for(index_type, overrides=index_params)),
         )
         
         logger.info(f"Created collection: {collection_name} with index: {index_type.value}")
@@ -185,18 +199,18 @@ class CollectionBuilder:
             logger.info(f"Restored to original collection: {original_collection}")
     
     @contextmanager
-    def use_chunk_strategy(self, chunk_strategy: ChunkStrategy):
+    def use_chunk_strategy(self, chunk_strategy: ChunkStrategy, collection_name: Optional[str] = None):
         """
         Context Manager: 临时切换 chunk_strategy 和 collection
         
         同时切换:
-        - settings.milvus_collection
+        - settings.milvus_collection（collection_name 为空时按 chunk 策略生成）
         - settings.chunk_strategy
         """
         original_collection = settings.milvus_collection
         original_strategy = settings.chunk_strategy
         
-        eval_collection = self._get_collection_name(chunk_strategy)
+        eval_collection = collection_name or self._get_collection_name(chunk_strategy)
         
         try:
             settings.milvus_collection = eval_collection
@@ -208,31 +222,57 @@ class CollectionBuilder:
             settings.chunk_strategy = original_strategy
             logger.info(f"Restored to: collection={original_collection}, strategy={original_strategy}")
     
+    @contextmanager
+    def bulk_load(
+        self,
+        chunk_strategy: ChunkStrategy,
+        index_type: IndexType,
+        collection_name: Optional[str] = None,
+        index_params: Optional[dict] = None
+    ):
+        """
+        Context Manager: 批量导入结束后再一次性构建目标 index
+
+        collection 应先以 FLAT 创建（无构建开销），导入期间不做增量 HNSW/IVF 建索引；
+        正常退出时 flush 并切换到 index_type，导入出错则保持 FLAT 不变。
+
+        Usage:
+            builder.create_collection(strategy, index_type=IndexType.FLAT, ...)
+            with builder.bulk_load(strategy, IndexType.HNSW):
+                ...  # insert
+        """
+        collection_name = collection_name or self._get_collection_name(chunk_strategy)
+        yield collection_name
+        self.client.flush(collection_name)
+        self.ensure_index(chunk_strategy, index_type, collection_name, index_params)
+    
     # ============== Index 管理 ==============
     
     def rebuild_index(
         self,
         chunk_strategy: ChunkStrategy,
-        index_type: IndexType
+        index_type: IndexType,
+        collection_name: Optional[str] = None,
+        index_params: Optional[dict] = None
     ) -> bool:
         """
         重建 collection 的 index
         
         Args:
-            chunk_strategy: 分块策略（决定哪个 collection）
+            chunk_strategy: 分块策略（决定默认 collection 名称）
             index_type: 目标 index 类型
+            collection_name: 指定 collection 名称
+            index_params: 覆盖默认的 index 构建参数
             
         Returns:
             是否成功
         """
-        collection_name = self._get_collection_name(chunk_strategy)
+        collection_name = collection_name or self._get_collection_name(chunk_strategy)
         
         if not self.client.has_collection(collection_name):
             logger.error(f"Collection does not exist: {collection_name}")
             return False
         
-        vector_field = settings.milvus_vector_field
-        
         try:
             # 1. Release collection（如果已 load）
             self.client.release_collection(collection_name)
@@ -244,20 +284,13 @@ class CollectionBuilder:
             )
             logger.info(f"Dropped old index on {collection_name}")
             
-            # 3. 创建新 index
-            index_config = INDEX_PARAMS.get(index_type, INDEX_PARAMS[IndexType.FLAT])
-            index_params = self.client.prepare_index_params()
-            index_params.add_index(
-                field_name=vector_field,
-                index_type=index_config["index_type"],
-                metric_type=settings.milvus_vector_index_metric_type,
-                index_name="vector_index",
-                params=index_config["params"],
-            )
-            
+            # 3. 创建新 index（数据已在 collection 里，IVF 的 nlist 按实际向量数计算）
+            n_vectors = self.client.get_collection_stats(collection_name).get("row_count", 0)
             self.client.create_index(
                 collection_name=collection_name,
-                index_params=index_params,
+                index_params=self._vector_index_params(
+                    index_type, index_params_for(index_type, n_vectors, index_params)
+                ),
             )
             
             # 4. Load collection
@@ -270,9 +303,13 @@ class CollectionBuilder:
             logger.error(f"Failed to rebuild index: {e}")
             return False
     
-    def get_current_index_type(self, chunk_strategy: ChunkStrategy) -> Optional[IndexType]:
+    def get_current_index_type(
+        self,
+        chunk_strategy: ChunkStrategy,
+        collection_name: Optional[str] = None
+    ) -> Optional[IndexType]:
         """获取当前 collection 的 index 类型"""
-        collection_name = self._get_collection_name(chunk_strategy)
+        collection_name = collection_name or self._get_collection_name(chunk_strategy)
         
         if not self.client.has_collection(collection_name):
             return None
@@ -301,6 +338,114 @@ class CollectionBuilder:
             logger.warning(f"Failed to get index type: {e}")
             return None
     
+    def ensure_index(
+        self,
+        chunk_strategy: ChunkStrategy,
+        index_type: IndexType,
+        collection_name: Optional[str] = None,
+        index_params: Optional[dict] = None
+    ) -> bool:
+        """
+        确保 collection 使用指定 index 及构建参数
+
+        类型或参数（如 HNSW 的 M）与现有 index 不同时只重建 index，不重新插入数据
+        """
+        collection_name = collection_name or self._get_collection_name(chunk_strategy)
+        if (
+            self.get_current_index_type(chunk_strategy, collection_name) == index_type
+            and self._index_params_match(collection_name, index_type, index_params)
+        ):
+            return True
+        return self.rebuild_index(chunk_strategy, index_type, collection_name, index_params)
+    
+    def _index_params_match(
+        self,
+        collection_name: str,
+        index_type: IndexType,
+        index_params: Optional[dict] = None
+    ) -> bool:
+        """现有 vector_index 的构建参数是否与 index_params_for(...) 的期望值一致"""
+        try:
+            info = self.client.describe_index(
+                collection_name=collection_name,
+                index_name="vector_index"
+            )
+            n_vectors = self.client.get_collection_stats(collection_name).get("row_count", 0)
+        except Exception as e:
+            logger.warning(f"Failed to describe index on {collection_name}: {e}")
+            return False
+        
+        # describe_index 的参数可能平铺在顶层，也可能放在 "params"（有时是 JSON 字符串）里；值一般是字符串
+        nested = info.get("params") or {}
+        if isinstance(nested, str):
+            try:
+                nested = json_loads(nested)
+            except ValueError:
+                nested = {}
+        actual = {**nested, **info}
+        expected = index_params_for(index_type, n_vectors, index_params)
+        mismatched = {k: (actual.get(k), v) for k, v in expected.items() if str(actual.get(k)) != str(v)}
+        if mismatched:
+            logger.info(f"Index params on {collection_name} differ (actual, expected): {mismatched}")
+        return not mismatched
+    
+    def _vector_index_params(self, index_type: IndexType, params: dict):
+        """向量字段的 IndexParams（统一命名为 vector_index）"""
+        index_config = INDEX_PARAMS.get(index_type, INDEX_PARAMS[IndexType.FLAT])
+        index_params = self.client.prepare_index_params()
+        index_params.add_index(
+            field_name=settings.milvus_vector_field,
+            index_type=index_config["index_type"],
+            metric_type=settings.milvus_vector_index_metric_type,
+            index_name="vector_index",
+            params=params,
+        )
+        return index_params
+    
+    # ============== 数据新鲜度 ==============
+    
+    def _marker_path(self, collection_name: str) -> Path:
+        """记录 collection 由哪一版 chunks 文件构建的标记文件"""
+        return self.config.collection_marker_file(collection_name)
+    
+    def chunks_signature(self, chunk_strategy: ChunkStrategy) -> list[int]:
+        """chunks 文件的指纹: [文件数, 总字节数, 最新 mtime_ns]"""
+        count = size = latest = 0
+        for path in self.config.iter_chunk_files(chunk_strategy):
+            st = path.stat()
+            count += 1
+            size += st.st_size
+            latest = max(latest, st.st_mtime_ns)
+        return [count, size, latest]
+    
+    def is_up_to_date(self, chunk_strategy: ChunkStrategy, collection_name: Optional[str] = None) -> bool:
+        """collection 存在且由当前的 chunks 文件构建（之后 chunks 没有变化）"""
+        collection_name = collection_name or self._get_collection_name(chunk_strategy)
+        marker = self._marker_path(collection_name)
+        if not marker.exists() or not self.client.has_collection(collection_name):
+            return False
+        try:
+            recorded = json_loads(marker.read_bytes()).get("chunks_signature")
+        except (ValueError, AttributeError):
+            return False
+        return recorded == self.chunks_signature(chunk_strategy)
+    
+    def mark_up_to_date(self, chunk_strategy: ChunkStrategy, collection_name: Optional[str] = None) -> None:
+        """数据导入完成后记录当前 chunks 指纹和向量数（供 EvaluationConfig.vector_count 直接读取）"""
+        collection_name = collection_name or self._get_collection_name(chunk_strategy)
+        try:
+            n_vectors = self.client.get_collection_stats(collection_name).get("row_count")
+        except Exception as e:
+            logger.warning(f"Failed to get row count of {collection_name}: {e}")
+            n_vectors = None
+        marker = self._marker_path(collection_name)
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.write_bytes(json_dumps_bytes({
+            "chunks_signature": self.chunks_signature(chunk_strategy),
+            "n_vectors": n_vectors,
+            "built_at": datetime.now().isoformat(),
+        }))
+    
     # ============== 统计 ==============
     
     def get_collection_stats(self, chunk_strategy: ChunkStrategy) -> Optional[CollectionStats]:
@@ -315,15 +460,8 @@ class CollectionBuilder:
             stats = self.client.get_collection_stats(collection_name)
             total_records = stats.get("row_count", 0)
             
-            # 获取 unique doc_id 数量（论文数）
-            # 查询所有 paper-level 记录
-            results = self.client.query(
-                collection_name=collection_name,
-                filter=f"{settings.milvus_chunk_id_field} == -1",
-                output_fields=[settings.milvus_doc_id_field],
-                limit=10000
-            )
-            total_papers = len(results)
+            # 论文数 = paper-level 记录数（chunk_id == -1）
+            total_papers = self._count_paper_records(collection_name)
             
             # 获取 index 类型
             index_type = self.get_current_index_type(chunk_strategy)
@@ -340,6 +478,38 @@ class CollectionBuilder:
             logger.error(f"Failed to get collection stats: {e}")
             return None
     
+    def _count_paper_records(self, collection_name: str) -> int:
+        """
+        统计 paper-level 记录数
+
+        优先用服务端 count(*) 聚合，只回传一个整数；不支持时退回 query_iterator 分批计数，
+        不在内存里保留任何一行，也没有 limit 截断。
+        """
+        paper_filter = f"{settings.milvus_chunk_id_field} == -1"
+        try:
+            results = self.client.query(
+                collection_name=collection_name,
+                filter=paper_filter,
+                output_fields=["count(*)"],
+            )
+            return int(results[0]["count(*)"])
+        except Exception as e:
+            logger.debug(f"count(*) not available for {collection_name}, counting with iterator: {e}")
+        
+        iterator = self.client.query_iterator(
+            collection_name=collection_name,
+            filter=paper_filter,
+            output_fields=[settings.milvus_doc_id_field],
+            batch_size=1000,
+        )
+        total = 0
+        try:
+            while batch := iterator.next():
+                total += len(batch)
+        finally:
+            iterator.close()
+        return total
+    
     def list_all_collections(self) -> list[str]:
         """列出所有 evaluation collection"""
         all_collections = self.client.list_collections()
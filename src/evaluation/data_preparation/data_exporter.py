@@ -4,11 +4,12 @@ Data Exporter
 从业务库导出论文元数据，作为评估的数据源
 """
 
-import json
 import random
+import re
+from collections import Counter
 from pathlib import Path
-from typing import TYPE_CHECKING, Optional
-from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, Collection, Iterable, Iterator, Optional, TypeVar
+from dataclasses import dataclass, fields
 
 from logging_config import logger
 
@@ -16,6 +17,30 @@ if TYPE_CHECKING:
     from rag.milvus import MilvusProvider
 
 from evaluation.config import EvaluationConfig
+from utils.json_utils import RAW_DOC_ID_PATTERN, decode_json_string, json_dumps_bytes, json_loads
+
+# 在原始字节上取 doc_id，被排除的行不必解析
+_DOC_ID_RE = re.compile(RAW_DOC_ID_PATTERN)
+
+T = TypeVar("T")
+
+
+def reservoir_sample(items: Iterable[T], k: int, seed: int = 42) -> list[T]:
+    """
+    蓄水池抽样（Algorithm R）：单次遍历从 items 中等概率抽取 k 个，内存 O(k)
+
+    items 不足 k 个时全部返回；seed 固定，保证可复现
+    """
+    rng = random.Random(seed)
+    reservoir: list[T] = []
+    for i, item in enumerate(items):
+        if i < k:
+            reservoir.append(item)
+        else:
+            j = rng.randint(0, i)
+            if j < k:
+                reservoir[j] = item
+    return reservoir
 
 
 @dataclass
@@ -29,6 +54,13 @@ class PaperSource:
     conference_name: str = ""
     conference_year: int = 0
     conference_round: str = ""
+    
+    def to_record(self) -> dict:
+        """字段都是标量，直接按字段名取值，省去 asdict 的递归深拷贝"""
+        return {name: getattr(self, name) for name in _PAPER_SOURCE_FIELDS}
+
+
+_PAPER_SOURCE_FIELDS = tuple(f.name for f in fields(PaperSource))
 
 
 class DataExporter:
@@ -43,25 +75,38 @@ class DataExporter:
         self.rag_client = rag_client
         self.config = config or EvaluationConfig()
     
+    # query_iterator 每页记录数
+    QUERY_BATCH_SIZE = 1000
+    
     def export(
         self,
         conference: Optional[str] = None,
         year: Optional[int] = None,
         sample_size: Optional[int] = None
-    ) -> list[PaperSource]:
+    ) -> Iterator[PaperSource]:
         """
         从业务库导出论文元数据
         
-        只导出有 pdf_url 的论文（paper-level 记录，chunk_id == -1）
+        只导出有 pdf_url 的论文（paper-level 记录，chunk_id == -1）。
+        用 query_iterator 分页读取、逐个 yield，没有条数上限，内存只占一页。
         
         Args:
             conference: 筛选特定会议（可选）
             year: 筛选特定年份（可选）
-            sample_size: 抽样数量，None 表示全量
+            sample_size: 抽样数量，None 表示全量（抽样时用蓄水池抽样，仍只遍历一次）
             
         Returns:
-            PaperSource 列表
+            PaperSource 迭代器
         """
+        papers = self._iter_papers(conference, year)
+        if sample_size:
+            sampled = reservoir_sample(papers, sample_size)
+            logger.info(f"Sampled {len(sampled)} papers")
+            return iter(sampled)
+        return papers
+    
+    def _iter_papers(self, conference: Optional[str], year: Optional[int]) -> Iterator[PaperSource]:
+        """按页查询 paper-level 记录，过滤掉没有 pdf_url 的"""
         # 构建查询条件：paper-level 记录 (chunk_id == -1) 且有 pdf_url
         filters = [f"{self.rag_client.chunk_id_field} == -1"]
         
@@ -74,8 +119,8 @@ class DataExporter:
         
         logger.info(f"Querying papers with filter: {filter_expr}")
         
-        # 查询所有符合条件的 paper-level 记录
-        results = self.rag_client.client.query(
+        # 分页查询所有符合条件的 paper-level 记录
+        iterator = self.rag_client.client.query_iterator(
             collection_name=self.rag_client.collection,
             filter=filter_expr,
             output_fields=[
@@ -88,38 +133,34 @@ class DataExporter:
                 self.rag_client.conference_year_field,
                 self.rag_client.conference_round_field,
             ],
-            limit=10000  # 足够大，获取全部
+            batch_size=self.QUERY_BATCH_SIZE,
         )
         
-        logger.info(f"Found {len(results)} paper-level records")
-        
-        # 过滤有 pdf_url 的记录，并转换为 PaperSource
-        papers: list[PaperSource] = []
-        for r in results:
-            pdf_url = r.get(self.rag_client.pdf_url_field, "")
-            if not pdf_url or not pdf_url.strip():
-                continue  # 跳过没有 pdf_url 的
-            
-            papers.append(PaperSource(
-                doc_id=r.get(self.rag_client.doc_id_field, ""),
-                title=r.get(self.rag_client.title_field, ""),
-                abstract=r.get(self.rag_client.text_field, ""),
-                pdf_url=pdf_url,
-                url=r.get(self.rag_client.url_field, ""),
-                conference_name=r.get(self.rag_client.conference_name_field, ""),
-                conference_year=r.get(self.rag_client.conference_year_field, 0),
-                conference_round=r.get(self.rag_client.conference_round_field, ""),
-            ))
-        
-        logger.info(f"Found {len(papers)} papers with pdf_url")
-        
-        # 抽样（如果需要）
-        if sample_size and sample_size < len(papers):
-            random.seed(42)  # 固定种子，保证可复现
-            papers = random.sample(papers, sample_size)
-            logger.info(f"Sampled {len(papers)} papers")
+        total = kept = 0
+        try:
+            while batch := iterator.next():
+                total += len(batch)
+                # 过滤有 pdf_url 的记录，并转换为 PaperSource
+                for r in batch:
+                    pdf_url = r.get(self.rag_client.pdf_url_field, "")
+                    if not pdf_url or not pdf_url.strip():
+                        continue  # 跳过没有 pdf_url 的
+                    
+                    kept += 1
+                    yield PaperSource(
+                        doc_id=r.get(self.rag_client.doc_id_field, ""),
+                        title=r.get(self.rag_client.title_field, ""),
+                        abstract=r.get(self.rag_client.text_field, ""),
+                        pdf_url=pdf_url,
+                        url=r.get(self.rag_client.url_field, ""),
+                        conference_name=r.get(self.rag_client.conference_name_field, ""),
+                        conference_year=r.get(self.rag_client.conference_year_field, 0),
+                        conference_round=r.get(self.rag_client.conference_round_field, ""),
+                    )
+        finally:
+            iterator.close()
         
-        return papers
+        logger.info(f"Found {total} paper-level records, {kept} with pdf_url")
     
     def export_to_file(
         self,
@@ -136,42 +177,64 @@ class DataExporter:
         Returns:
             导出的论文数量
         """
-        papers = self.export(**kwargs)
-        
         output_path = output_path or self.config.source_file
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(output_path, "w", encoding="utf-8") as f:
-            for paper in papers:
-                f.write(json.dumps(asdict(paper), ensure_ascii=False) + "\n")
+        count = 0
+        
+        def encoded():
+            nonlocal count
+            for paper in self.export(**kwargs):
+                count += 1
+                yield json_dumps_bytes(paper.to_record()) + b"\n"
+        
+        # 逐行预编码为 bytes，由 writelines 交给缓冲写入
+        with open(output_path, "wb") as f:
+            f.writelines(encoded())
         
-        logger.info(f"Exported {len(papers)} papers to {output_path}")
-        return len(papers)
+        logger.info(f"Exported {count} papers to {output_path}")
+        return count
     
-    def load_from_file(self, input_path: Optional[Path] = None) -> list[PaperSource]:
+    def load_from_file(
+        self,
+        input_path: Optional[Path] = None,
+        exclude_doc_ids: Optional[Collection[str]] = None
+    ) -> list[PaperSource]:
         """
         从 JSONL 文件加载论文元数据
         
         Args:
             input_path: 输入路径，默认使用 config 中的路径
+            exclude_doc_ids: 跳过这些 doc_id（例如已标注的论文），对应行不会被解析和构造对象
             
         Returns:
             PaperSource 列表
         """
         input_path = input_path or self.config.source_file
+        papers = list(self.iter_from_file(input_path, exclude_doc_ids))
+        logger.info(f"Loaded {len(papers)} papers from {input_path}")
+        return papers
+    
+    def iter_from_file(
+        self,
+        input_path: Optional[Path] = None,
+        exclude_doc_ids: Optional[Collection[str]] = None
+    ) -> Iterator[PaperSource]:
+        """逐行读取 JSONL，按需构造 PaperSource，不在内存中保留整份语料"""
+        input_path = input_path or self.config.source_file
         
         if not input_path.exists():
             raise FileNotFoundError(f"Source file not found: {input_path}")
         
-        papers: list[PaperSource] = []
-        with open(input_path, "r", encoding="utf-8") as f:
+        with open(input_path, "rb") as f:
             for line in f:
-                if line.strip():
-                    data = json.loads(line)
-                    papers.append(PaperSource(**data))
-        
-        logger.info(f"Loaded {len(papers)} papers from {input_path}")
-        return papers
+                if not line.strip():
+                    continue
+                if exclude_doc_ids:
+                    m = _DOC_ID_RE.search(line)
+                    if m and decode_json_string(m.group(1)) in exclude_doc_ids:
+                        continue
+                yield PaperSource(**json_loads(line))
     
     def get_stats(self, papers: list[PaperSource]) -> dict:
         """
@@ -183,20 +246,12 @@ class DataExporter:
         if not papers:
             return {"total": 0}
         
-        # 按会议统计
-        by_conference: dict[str, int] = {}
-        for p in papers:
-            conf = p.conference_name or "unknown"
-            by_conference[conf] = by_conference.get(conf, 0) + 1
-        
-        # 按年份统计
-        by_year: dict[int, int] = {}
-        for p in papers:
-            year = p.conference_year or 0
-            by_year[year] = by_year.get(year, 0) + 1
+        # 按会议 / 年份统计（Counter 的计数循环在 C 里完成）
+        by_conference = Counter(p.conference_name or "unknown" for p in papers)
+        by_year = Counter(p.conference_year or 0 for p in papers)
         
         return {
             "total": len(papers),
-            "by_conference": by_conference,
+            "by_conference": dict(by_conference),
             "by_year": dict(sorted(by_year.items())),
         }
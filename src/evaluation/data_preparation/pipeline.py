@@ -8,6 +8,7 @@ Data Preparation Pipeline
 """
 
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import TYPE_CHECKING, Optional
 from pathlib import Path
 from dataclasses import dataclass, field
@@ -18,7 +19,7 @@ if TYPE_CHECKING:
     from rag.milvus import MilvusProvider
     from langchain_core.language_models.chat_models import BaseChatModel
 
-from evaluation.config import EvaluationConfig, ChunkStrategy
+from evaluation.config import EvaluationConfig, ChunkStrategy, IndexType
 from evaluation.data_preparation.data_exporter import DataExporter, PaperSource
 from evaluation.data_preparation.collection_builder import CollectionBuilder
 
@@ -133,10 +134,9 @@ class DataPreparationPipeline:
             logger.info(f"Loading papers from existing file: {self.config.source_file}")
             papers = self.exporter.load_from_file()
         else:
-            # 从数据库导出（全量）
-            papers = self.exporter.export()
-            # 保存到文件
+            # 从数据库导出（全量）并流式写入文件，再从文件读回
             self.exporter.export_to_file()
+            papers = self.exporter.load_from_file()
         
         # 如果需要抽样
         if sample_size and sample_size < len(papers):
@@ -171,16 +171,13 @@ class DataPreparationPipeline:
             drop_if_exists=drop_existing
         )
         
-        # 2. 准备 chunks 保存目录
-        chunks_dir = self.config.chunks_dir / strategy.value
-        chunks_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 3. 创建保存 chunks 的回调
+        # 2. 创建保存 chunks 的回调（按 doc_id 前缀分子目录，写入时按需创建）
         self._chunks_saved_count = 0
         
         def save_chunks_callback(doc_id: str, chunks: list[dict], title: str):
             """保存 chunks 到本地文件"""
-            save_path = chunks_dir / f"{doc_id}.json"
+            save_path = self.config.chunk_file(strategy, doc_id)
+            save_path.parent.mkdir(parents=True, exist_ok=True)
             with open(save_path, "w", encoding="utf-8") as f:
                 json.dump({
                     "doc_id": doc_id,
@@ -190,12 +187,12 @@ class DataPreparationPipeline:
                 }, f, ensure_ascii=False, indent=2)
             self._chunks_saved_count += 1
         
-        # 4. 使用 Context Manager 切换到评估 collection 和 chunk 策略
+        # 3. 使用 Context Manager 切换到评估 collection 和 chunk 策略
         with self.collection_builder.use_chunk_strategy(strategy):
             # 创建新的 MilvusProvider（会使用修改后的 settings）
             eval_rag_client = MilvusProvider()
             
-            # 5. 复制 paper-level 记录到评估 collection
+            # 4. 复制 paper-level 记录到评估 collection
             # PDFLoader 需要从 collection 查询 metadata
             logger.info(f"Copying {len(papers)} paper-level records to eval collection...")
             self._copy_paper_records(papers, eval_rag_client)
@@ -257,6 +254,8 @@ class DataPreparationPipeline:
         
         PDFLoader 需要从 collection 查询 metadata（pdf_url 等）
         """
+        from rag.retriever import bump_corpus_epoch
+        
         for paper in papers:
             # 使用 insert_document 插入 paper-level 记录
             # 但需要保持原有的 doc_id
@@ -280,13 +279,14 @@ class DataPreparationPipeline:
                     eval_rag_client.page_number_field: 1,
                 }
             )
+        bump_corpus_epoch()
         logger.info(f"Copied {len(papers)} paper-level records")
     
     # ============== 单独步骤方法（便于调试） ==============
     
     def export_only(self, sample_size: Optional[int] = None) -> list[PaperSource]:
         """只执行导出步骤"""
-        return self.exporter.export(sample_size=sample_size)
+        return list(self.exporter.export(sample_size=sample_size))
     
     def get_collection_stats(self, strategy: ChunkStrategy) -> Optional[dict]:
         """获取指定策略的 collection 统计"""
@@ -304,6 +304,11 @@ class DataPreparationPipeline:
         self,
         strategy: ChunkStrategy = ChunkStrategy.PARAGRAPH,
         drop_existing: bool = True,
+        index_type: IndexType = IndexType.FLAT,
+        collection_name: Optional[str] = None,
+        eval_rag_client: Optional["MilvusProvider"] = None,
+        force: bool = True,
+        index_params: Optional[dict] = None,
     ) -> int:
         """
         从已保存的 chunks 文件重建评估 collection
@@ -313,6 +318,11 @@ class DataPreparationPipeline:
         Args:
             strategy: 分块策略
             drop_existing: 是否删除已有 collection
+            index_type: 向量索引类型
+            collection_name: 目标 collection，默认按 chunk 策略命名
+            eval_rag_client: 复用的 MilvusProvider，会被切换到目标 collection；为空时新建
+            force: False 时，若 collection 已由当前 chunks 文件构建，则只按需切换 index，不重新 embedding/插入
+            index_params: 覆盖默认的 index 构建参数
             
         Returns:
             成功插入的 chunks 数量
@@ -325,64 +335,89 @@ class DataPreparationPipeline:
             logger.error(f"Chunks directory not found: {chunks_dir}")
             return 0
         
-        chunk_files = list(chunks_dir.glob("*.json"))
+        chunk_files = list(self.config.iter_chunk_files(strategy))
         if not chunk_files:
             logger.error(f"No chunk files found in {chunks_dir}")
             return 0
         
+        if not force and self.collection_builder.is_up_to_date(strategy, collection_name):
+            # 数据没变：index 不同只重建 index（release/drop_index/create_index/load），不碰向量
+            self.collection_builder.ensure_index(strategy, index_type, collection_name, index_params)
+            logger.info(f"Collection {collection_name or strategy.value} is up to date with chunk files, skipping re-insert")
+            return 0
+        
         logger.info(f"Rebuilding collection from {len(chunk_files)} chunk files...")
         
-        # 1. 创建/重建 collection
-        self.collection_builder.create_collection(strategy, drop_if_exists=drop_existing)
+        # 1. 创建/重建 collection：先用 FLAT，数据导入完再一次性构建目标 index
+        self.collection_builder.create_collection(
+            strategy,
+            index_type=IndexType.FLAT,
+            drop_if_exists=drop_existing,
+            collection_name=collection_name,
+        )
         
         total_chunks = 0
         
         # 2. 切换到评估 collection
-        with self.collection_builder.use_chunk_strategy(strategy):
-            eval_rag_client = MilvusProvider()
+        with self.collection_builder.use_chunk_strategy(strategy, collection_name) as eval_collection:
+            if eval_rag_client is None:
+                eval_rag_client = MilvusProvider()
+            else:
+                eval_rag_client.use_collection(eval_collection)
             
-            for chunk_file in chunk_files:
-                with open(chunk_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                
-                doc_id = data["doc_id"]
-                title = data["title"]
-                chunks = data["chunks"]
-                
-                # 加载 source paper 信息（从文件或数据库）
-                paper_info = self._get_paper_info(doc_id)
-                
-                # 插入 paper-level 记录
-                eval_rag_client.client.insert(
-                    collection_name=eval_rag_client.collection,
-                    data={
-                        eval_rag_client.doc_id_field: doc_id,
-                        eval_rag_client.vector_field: eval_rag_client.embedding_client.embed_query(
-                            f"Title: {title}\nAbstract: {paper_info.get('abstract', '')[:500]}"
-                        ),
-                        eval_rag_client.title_field: title,
-                        eval_rag_client.text_field: paper_info.get("abstract", ""),
-                        eval_rag_client.url_field: paper_info.get("url", ""),
-                        eval_rag_client.pdf_url_field: paper_info.get("pdf_url", ""),
-                        eval_rag_client.conference_name_field: paper_info.get("conference_name", ""),
-                        eval_rag_client.conference_year_field: paper_info.get("conference_year", 0),
-                        eval_rag_client.conference_round_field: paper_info.get("conference_round", ""),
-                        eval_rag_client.chunk_id_field: -1,
-                        eval_rag_client.section_category_field: 0,
-                        eval_rag_client.parent_section_field: "",
-                        eval_rag_client.page_number_field: 1,
-                    }
-                )
-                
-                # 插入 chunks
-                eval_rag_client.insert_paper_chunks(doc_id, chunks, title)
-                total_chunks += len(chunks)
-                
-                logger.info(f"Inserted {len(chunks)} chunks for {doc_id[:8]}...")
-        
+            # 每篇论文的 embedding + insert 互相独立，多线程并发以掩盖网络往返延迟
+            workers = max(1, min(self.config.insert_workers, len(chunk_files)))
+            with self.collection_builder.bulk_load(strategy, index_type, collection_name, index_params), \
+                    ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rebuild") as pool:
+                for inserted in pool.map(
+                    lambda path: self._insert_chunk_file(path, eval_rag_client),
+                    chunk_files,
+                ):
+                    total_chunks += inserted
+        
+        self.collection_builder.mark_up_to_date(strategy, collection_name)
         logger.info(f"Rebuild complete: {total_chunks} chunks from {len(chunk_files)} papers")
         return total_chunks
     
+    def _insert_chunk_file(self, chunk_file: Path, eval_rag_client: "MilvusProvider") -> int:
+        """导入单个 chunks 文件：paper-level 记录 + 全部 chunks，返回 chunk 数"""
+        with open(chunk_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        
+        doc_id = data["doc_id"]
+        title = data["title"]
+        chunks = data["chunks"]
+        
+        # 加载 source paper 信息（从文件或数据库）
+        paper_info = self._get_paper_info(doc_id)
+        
+        # 插入 paper-level 记录
+        eval_rag_client.client.insert(
+            collection_name=eval_rag_client.collection,
+            data={
+                eval_rag_client.doc_id_field: doc_id,
+                eval_rag_client.vector_field: eval_rag_client.embedding_client.embed_query(
+                    f"Title: {title}\nAbstract: {paper_info.get('abstract', '')[:500]}"
+                ),
+                eval_rag_client.title_field: title,
+                eval_rag_client.text_field: paper_info.get("abstract", ""),
+                eval_rag_client.url_field: paper_info.get("url", ""),
+                eval_rag_client.pdf_url_field: paper_info.get("pdf_url", ""),
+                eval_rag_client.conference_name_field: paper_info.get("conference_name", ""),
+                eval_rag_client.conference_year_field: paper_info.get("conference_year", 0),
+                eval_rag_client.conference_round_field: paper_info.get("conference_round", ""),
+                eval_rag_client.chunk_id_field: -1,
+                eval_rag_client.section_category_field: 0,
+                eval_rag_client.parent_section_field: "",
+                eval_rag_client.page_number_field: 1,
+            }
+        )
+        
+        # 插入 chunks
+        eval_rag_client.insert_paper_chunks(doc_id, chunks, title)
+        logger.info(f"Inserted {len(chunks)} chunks for {doc_id[:8]}...")
+        return len(chunks)
+    
     def _get_paper_info(self, doc_id: str) -> dict:
         """获取论文信息（从 source_papers.jsonl 或数据库）"""
         # 先尝试从文件加载
@@ -47,7 +47,7 @@ from evaluation.qa_generation.prompts import (
 )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ChunkInfo:
     """Chunk 信息（从文件加载）"""
     doc_id: str
@@ -95,7 +95,7 @@ class QAGenerator:
         
         all_chunks: dict[str, list[ChunkInfo]] = {}
         
-        for chunk_file in chunks_dir.glob("*.json"):
+        for chunk_file in self.config.iter_chunk_files(strategy):
             with open(chunk_file, "r", encoding="utf-8") as f:
                 data = json.load(f)
             
@@ -49,8 +49,8 @@ class EvaluationRunner:
         self.llm = llm_client
         self.config = config or EvaluationConfig()
         
-        # 确保报告目录存在
-        self.config.reports_dir.mkdir(parents=True, exist_ok=True)
+        # 确保报告目录存在（每个进程只检查一次）
+        self.config.ensure_dirs()
     
     def run_all(self, ground_truth: Optional[GroundTruth] = None) -> EvaluationReport:
         """
@@ -4,10 +4,12 @@
 所有标注、QA、评估结果的 schema 都在这里定义。
 """
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from enum import Enum
 from typing import Optional
 
+from pydantic import BaseModel, Field
+
 
 # ============== 标注相关 Schema ==============
 
@@ -33,6 +35,37 @@ class PaperAnnotation:
     # 元信息
     annotated_at: str = ""               # 标注时间
     has_pdf_loaded: bool = False         # PDF 是否已加载
+    content_hash: str = ""               # hash(title, abstract)，内容相同的论文共用标注
+    
+    @classmethod
+    def from_record(cls, record: dict) -> "PaperAnnotation":
+        """从本项目自己写出的 JSONL 记录构造（不做校验）；忽略旧/新版本 schema 中多出的字段"""
+        try:
+            return cls(**record)
+        except TypeError:
+            known = _PAPER_ANNOTATION_FIELD_SET
+            return cls(**{k: v for k, v in record.items() if k in known})
+    
+    def to_record(self) -> dict:
+        """转成可序列化的 dict；字段都是标量或扁平 list，不需要 asdict 的递归深拷贝"""
+        return {name: getattr(self, name) for name in _PAPER_ANNOTATION_FIELDS}
+
+
+_PAPER_ANNOTATION_FIELDS = tuple(f.name for f in fields(PaperAnnotation))
+_PAPER_ANNOTATION_FIELD_SET = frozenset(_PAPER_ANNOTATION_FIELDS)
+
+
+class PaperAnnotationOutput(BaseModel):
+    """Paper-level 标注的 LLM 结构化输出"""
+    summary: str = ""
+    keywords: list[str] = Field(default_factory=list)
+    research_area: str = ""
+
+
+class SectionAnnotationOutput(BaseModel):
+    """Section-level 标注的 LLM 结构化输出"""
+    summary: str = ""
+    keywords: list[str] = Field(default_factory=list)
 
 
 # ============== QA 相关 Schema ==============
@@ -22,6 +22,9 @@ if _loguru_logger is not None:
 
     logger = _loguru_logger
 
+    # setup_logging 设置的最低级别，供 log_enabled() 判断；loguru 本身没有公开的查询接口
+    _min_level_no = 0
+
     class InterceptHandler(logging.Handler):
         """Route standard logging records into loguru so libraries stay consistent."""
 
@@ -45,6 +48,7 @@ if _loguru_logger is not None:
         enqueue: bool = True,
     ) -> None:
         """Initialize loguru with a configurable sink and intercept stdlib logging."""
+        global _min_level_no
         logger.remove()
         logger.add(
             sink or sys.stdout,
@@ -55,6 +59,11 @@ if _loguru_logger is not None:
             diagnose=False,
         )
         logging.basicConfig(handlers=[InterceptHandler()], level=level, force=True)
+        _min_level_no = logger.level(level.upper()).no
+
+    def log_enabled(level: str = "INFO") -> bool:
+        """Whether a record at `level` would be emitted; use it to skip building expensive log messages."""
+        return logger.level(level).no >= _min_level_no
 
 else:
 
@@ -95,7 +104,11 @@ else:
 
         logging.basicConfig(level=numeric_level, handlers=[handler], force=True)
 
+    def log_enabled(level: str = "INFO") -> bool:
+        """Whether a record at `level` would be emitted; use it to skip building expensive log messages."""
+        return logger.isEnabledFor(getattr(logging, level.upper(), logging.INFO))
+
 
 setup_logging()
 
-__all__ = ["logger", "setup_logging", "PLAIN_LOG_FORMAT"]
+__all__ = ["logger", "setup_logging", "log_enabled", "PLAIN_LOG_FORMAT"]
@@ -6,6 +6,7 @@ import threading
 from typing import Any
 
 from agents.coordinator import invoke_coordinator
+from agents.searcher import warmup
 from prompts.template import apply_prompt_template
 
 from dotenv import load_dotenv
@@ -121,6 +122,8 @@ def run_tui() -> None:
                 )
                 logger.addHandler(file_handler)
             self.answer_widget.update("Ready. Ctrl+Q to quit. Ctrl+L to toggle logs.")
+            # 后台预热 RAG client / agent，避免第一次提问承担冷启动开销
+            threading.Thread(target=warmup, daemon=True).start()
 
         def _emit_log(self, message) -> None:
             text = str(message).rstrip("\n")
@@ -1,3 +1,6 @@
+from functools import lru_cache
+from typing import Any
+
 from settings import settings
 
 from langchain.chat_models import init_chat_model
@@ -39,9 +42,14 @@ def init_deepseek(model_name="deepseek-chat"):
     return model
 
 
+@lru_cache(maxsize=8)
 def get_llm_by_usage(usage: str = "evaluation", model_name: str | None = None) -> BaseChatModel:
     """Return a chat LLM tailored for a specific usage.
 
+    Instances are cached per (usage, model_name), so every caller asking for the same
+    usage shares one client and its HTTP connection pool. Call
+    `get_llm_by_usage.cache_clear()` after changing API keys or endpoints in settings.
+
     Args:
         usage: One of 'agentic', 'evaluation', 'contextual'.
         model_name: Optional model name override for providers that support it.
@@ -69,4 +77,39 @@ def get_llm_by_usage(usage: str = "evaluation", model_name: str | None = None) -
             raise e
 
     # Default fallback: ModelScope
-    return init_chat_model_from_modelscope(model_name or "deepseek-ai/DeepSeek-V3.2-Exp")
\ No newline at end of file
+    return init_chat_model_from_modelscope(model_name or "deepseek-ai/DeepSeek-V3.2-Exp")
+
+
+def cacheable_system_message(llm, text: str) -> dict[str, Any]:
+    """Wrap a constant system prompt so it can hit the provider's prompt-prefix cache.
+
+    Anthropic models need an explicit cache_control breakpoint; OpenAI-compatible
+    providers (Kimi, DeepSeek) cache identical prefixes automatically and may reject
+    unknown block keys, so they get the plain string.
+    """
+    if getattr(llm, "_llm_type", "") == "anthropic-chat":
+        return {
+            "role": "system",
+            "content": [{
+                "type": "text",
+                "text": text,
+                "cache_control": {"type": "ephemeral"},
+            }],
+        }
+    return {"role": "system", "content": text}
+
+
+def structured_output_llm(llm: BaseChatModel, schema: Any) -> Any:
+    """Bind `schema` to the model via the provider's JSON mode.
+
+    JSON mode (response_format=json_object) is what the OpenAI-compatible endpoints
+    we use (DeepSeek, Kimi, ModelScope) support; strict json_schema is not. The
+    prompt must still describe the fields and mention JSON. Returns None when the
+    model class has no structured-output support, so callers can fall back to
+    parsing text. Providers without json_mode (e.g. Anthropic) reject the
+    `method` kwarg with ValueError, which is treated the same way.
+    """
+    try:
+        return llm.with_structured_output(schema, method="json_mode")
+    except (NotImplementedError, ValueError):
+        return None
@@ -2,16 +2,10 @@ import fitz  # PyMuPDF
 from bs4 import BeautifulSoup
 import os
 import re
-from enum import IntEnum
 
-class SectionCategory(IntEnum):
-    ABSTRACT = 0
-    INTRODUCTION = 1
-    METHOD = 2
-    EVALUATION = 3
-    CONCLUSION = 4
-    OTHER = 5
-    RELATED_WORK = 6
+# SectionCategory lives in a dependency-free leaf module so callers that only
+# need the enum don't pull in PyMuPDF; re-exported here for compatibility.
+from parser.section_category import SectionCategory, SECTION_CATEGORY_NAMES
 
 def classify_section(title: str, paper_title: str = "") -> int:
     """
@@ -0,0 +1,13 @@
+from enum import IntEnum
+
+class SectionCategory(IntEnum):
+    ABSTRACT = 0
+    INTRODUCTION = 1
+    METHOD = 2
+    EVALUATION = 3
+    CONCLUSION = 4
+    OTHER = 5
+    RELATED_WORK = 6
+
+# value -> name lookup, avoids SectionCategory(x).name raising on unknown values
+SECTION_CATEGORY_NAMES = {c.value: c.name for c in SectionCategory}
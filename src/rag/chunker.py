@@ -1,14 +1,16 @@
 import re
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from typing import Optional, TYPE_CHECKING
 
+from models import cacheable_system_message
 from settings import settings
 
 if TYPE_CHECKING:
     from langchain_core.language_models.chat_models import BaseChatModel
 
 
-@dataclass
+@dataclass(slots=True)
 class ChunkResult:
     """
     分块结果，包含原始文本、上下文前缀和结构化元数据
@@ -31,12 +33,15 @@ class ChunkResult:
     # 调试信息
     debug_info: dict = field(default_factory=dict)
     
-    @property
-    def text_for_embedding(self) -> str:
-        """用于 embedding 的文本：如果有 contextual_prefix 则拼接"""
+    # 用于 embedding 的文本：如果有 contextual_prefix 则拼接。构造时拼好一次，
+    # 随 to_dict() 写进 chunks 文件，重建 collection 时直接读取，不再重新格式化
+    text_for_embedding: str = field(init=False, default="")
+    
+    def __post_init__(self) -> None:
         if self.contextual_prefix:
-            return f"{self.contextual_prefix}\n\n{self.chunk_text}"
-        return self.chunk_text
+            self.text_for_embedding = f"{self.contextual_prefix}\n\n{self.chunk_text}"
+        else:
+            self.text_for_embedding = self.chunk_text
     
     def to_dict(self) -> dict:
         """转换为字典格式，兼容 milvus.insert_paper_chunks"""
@@ -94,12 +99,15 @@ class Chunker:
         chunk_size: int = 800,
         chunk_overlap: int = 100,
         min_chunk_size: int = 100,
+        context_workers: int = 8,
     ):
         self.strategy = settings.chunk_strategy
         self.llm_client = llm_client
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.min_chunk_size = min_chunk_size
+        # 同一篇论文内并发生成 contextual prefix 的 LLM 请求数（纯网络 I/O，线程即可）
+        self.context_workers = context_workers
 
     def process_chunks(
         self, 
@@ -163,32 +171,36 @@ class Chunker:
         
         # Step 1: Sentence-Merge 预处理
         preprocessed_chunks = self._sentence_merge_preprocess(chunks)
+        if not preprocessed_chunks:
+            return []
         
-        result_chunks: list[ChunkResult] = []
-        
-        for chunk in preprocessed_chunks:
-            chunk_text = chunk["text"]
-            section_title = chunk.get("section_title", "")
-            
-            try:
-                # 生成 contextual prefix
-                prefix = self._generate_context_prefix(
-                    title=title,
-                    full_document=full_text,
-                    chunk_text=chunk_text,
-                    section_title=section_title
-                )
-                result_chunks.append(ChunkResult.from_pdf_parser_chunk(
-                    chunk, 
-                    contextual_prefix=prefix
-                ))
-            except Exception as e:
-                # 生成失败时，使用空前缀
-                result = ChunkResult.from_pdf_parser_chunk(chunk, contextual_prefix="")
-                result.debug_info = {"error": str(e)}
-                result_chunks.append(result)
-        
-        return result_chunks
+        # Step 2: 各 chunk 的 prefix 互不依赖，并发请求 LLM；map 保持原有顺序。
+        # 所有请求共用同一条文档 system 消息，服务端的前缀缓存只需处理一次全文
+        context_message = self._document_context_message(title, full_text)
+        workers = min(self.context_workers, len(preprocessed_chunks))
+        if workers <= 1:
+            return [self._contextualize_chunk(c, context_message) for c in preprocessed_chunks]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ctx-chunk") as pool:
+            return list(pool.map(
+                lambda c: self._contextualize_chunk(c, context_message),
+                preprocessed_chunks,
+            ))
+    
+    def _contextualize_chunk(self, chunk: dict, context_message: dict) -> ChunkResult:
+        """为单个 chunk 生成 contextual prefix；失败时使用空前缀"""
+        try:
+            prefix = self._generate_context_prefix(
+                title="",
+                full_document="",
+                chunk_text=chunk["text"],
+                section_title=chunk.get("section_title", ""),
+                context_message=context_message
+            )
+            return ChunkResult.from_pdf_parser_chunk(chunk, contextual_prefix=prefix)
+        except Exception as e:
+            result = ChunkResult.from_pdf_parser_chunk(chunk, contextual_prefix="")
+            result.debug_info = {"error": str(e)}
+            return result
     
     # ============== Sentence-Merge 预处理 ==============
     
@@ -430,27 +442,31 @@ class Chunker:
         
         return "\n\n".join(parts)
     
-    def _generate_context_prefix(
+    def _document_context_message(
         self,
         title: str,
         full_document: str,
-        chunk_text: str,
-        section_title: str = "",
         max_doc_length: int = 8000
-    ) -> str:
+    ) -> dict:
         """
-        使用 LLM 生成 chunk 的上下文前缀
+        同一篇论文所有 chunk 共用的 system 消息：固定说明 + 标题 + 全文
+
+        放在 prompt 最前面且逐字相同，Ollama/vLLM 的前缀 KV cache 只需 prefill 一次全文，
+        Anthropic 则通过 cache_control 命中 prompt cache。
         """
-        if not self.llm_client:
-            return ""
-        
         # 截断全文
         if len(full_document) > max_doc_length:
             full_document = full_document[:max_doc_length] + "\n... [document truncated]"
         
-        section_hint = f"\nThis chunk is from the section: {section_title}" if section_title else ""
-        
-        prompt = f"""You are an assistant that helps situate a chunk of text within the context of a larger document.
+        text = f"""You are an assistant that helps situate a chunk of text within the context of a larger document.
+
+Given a chunk from the document below, provide a short, succinct context (1-2 sentences) that helps situate this chunk within the overall document.
+The context should:
+1. Explain where this content appears in the document structure
+2. Briefly mention what topic or concept is being discussed
+3. NOT repeat the content of the chunk itself
+
+Respond with ONLY the context text, no explanations or formatting.
 
 <document_title>
 {title}
@@ -458,21 +474,40 @@ class Chunker:
 
 <document>
 {full_document}
-</document>
+</document>"""
+        return cacheable_system_message(self.llm_client, text)
+    
+    def _generate_context_prefix(
+        self,
+        title: str,
+        full_document: str,
+        chunk_text: str,
+        section_title: str = "",
+        max_doc_length: int = 8000,
+        context_message: Optional[dict] = None
+    ) -> str:
+        """
+        使用 LLM 生成 chunk 的上下文前缀
 
-Here is the chunk we want to situate:{section_hint}
+        context_message 为 _document_context_message() 的结果；同一篇论文的多个 chunk 应传入同一个对象，
+        为空时按 title/full_document 现场构建。
+        """
+        if not self.llm_client:
+            return ""
+        
+        if context_message is None:
+            context_message = self._document_context_message(title, full_document, max_doc_length)
+        
+        # 每个 chunk 不同的部分只出现在最后的 user 消息里
+        section_hint = f"This chunk is from the section: {section_title}\n\n" if section_title else ""
+        prompt = [
+            context_message,
+            {"role": "user", "content": f"""{section_hint}Here is the chunk we want to situate:
 
 <chunk>
 {chunk_text}
-</chunk>
-
-Please provide a short, succinct context (1-2 sentences) that helps situate this chunk within the overall document. 
-The context should:
-1. Explain where this content appears in the document structure
-2. Briefly mention what topic or concept is being discussed
-3. NOT repeat the content of the chunk itself
-
-Respond with ONLY the context text, no explanations or formatting."""
+</chunk>"""},
+        ]
 
         response = self.llm_client.invoke(prompt)
         # 处理 LangChain 的响应格式
@@ -552,12 +587,14 @@ Respond with ONLY the context text, no explanations or formatting."""
         
         result_chunks: list[ChunkResult] = []
         
+        context_message = self._document_context_message(title, text)
         for idx, chunk in enumerate(base_chunks):
             try:
                 prefix = self._generate_context_prefix(
                     title=title,
                     full_document=text,
-                    chunk_text=chunk.chunk_text
+                    chunk_text=chunk.chunk_text,
+                    context_message=context_message
                 )
                 result_chunks.append(ChunkResult(
                     chunk_text=chunk.chunk_text,
@@ -1,8 +1,35 @@
-from typing import Any, Callable, Dict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator
 
 from langchain_huggingface import HuggingFaceEndpointEmbeddings
 from langchain_ollama import OllamaEmbeddings
 
+from rag.kv_cache import get_kv_cache, make_key
+from settings import settings
+
+# Per-request query embedding cache, see embedding_scope()
+_request_embeddings: ContextVar[dict[str, list[float]] | None] = ContextVar("request_embeddings", default=None)
+
+
+@contextmanager
+def embedding_scope(cache: dict[str, list[float]] | None = None) -> Iterator[dict[str, list[float]]]:
+    """Reuse query embeddings for the duration of one request.
+
+    Inside the scope, embed_query() computes each distinct query text once; the
+    dict is shared with asyncio tasks and asyncio.to_thread workers started from
+    within the scope (they copy the context, not the dict). Pass a pre-filled
+    dict (e.g. from embed_queries()) to carry embeddings across several scopes.
+    """
+    if cache is None:
+        cache = {}
+    token = _request_embeddings.set(cache)
+    try:
+        yield cache
+    finally:
+        _request_embeddings.reset(token)
+
 # Use register to get class
 
 class FeatureExtractor:
@@ -20,6 +47,10 @@ class FeatureExtractor:
 
         # factory returns a client instance
         self.client = factory(api_key, model)
+        self.provider = provider
+        self.model = model
+        # 进程内 LRU 挡在持久化 kv cache 之前；实例绑定 provider/model，换模型即换缓存
+        self._embed_query_cached = lru_cache(maxsize=settings.embedding_lru_size)(self._embed_query)
 
     # Registry of provider name -> factory(api_key, model) callable
     _providers: Dict[str, Callable[[str, str], Any]] = {}
@@ -42,11 +73,64 @@ class FeatureExtractor:
         """Return a list of supported provider names."""
         return list(cls._providers.keys())
     
-    def embed_text(self, text:list[str]): 
-        return self.client.embed_text(text)
+    def embed_text(self, texts: list[str], batch_size: int | None = None) -> list[list[float]]:
+        """Embed document texts in order, batch_size texts per provider call instead of one call per text.
+
+        Bypasses the kv cache on purpose: that cache holds query embeddings, and a
+        bulk chunk load would evict them all while committing once per vector.
+        """
+        batch_size = batch_size or settings.embedding_batch_size
+        vectors: list[list[float]] = []
+        for start in range(0, len(texts), batch_size):
+            vectors.extend(self.client.embed_documents(texts[start:start + batch_size]))
+        return vectors
 
     def embed_query(self, text:str):
-        return self.client.embed_query(text)
+        scoped = _request_embeddings.get()
+        if scoped is not None:
+            vec = scoped.get(text)
+            if vec is None:
+                vec = self._embed_query_cached(text)
+                scoped[text] = vec
+            return vec
+        return self._embed_query_cached(text)
+
+    def embed_queries(self, texts: list[str], batch_size: int | None = None) -> dict[str, list[float]]:
+        """Embed many query texts up front; returns {text: vector} for the distinct texts.
+
+        Texts already in the kv cache are served from it, the rest go to the
+        provider in batches of batch_size (default settings.embedding_batch_size)
+        instead of one request per text.
+        """
+        batch_size = batch_size or settings.embedding_batch_size
+        result: dict[str, list[float]] = {}
+        cache = get_kv_cache()
+        missing: list[str] = []
+        for text in dict.fromkeys(texts):
+            vec = cache.get_embedding(make_key(self.provider, self.model, text)) if cache is not None else None
+            if vec is None:
+                missing.append(text)
+            else:
+                result[text] = vec
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            for text, vec in zip(batch, self.client.embed_documents(batch)):
+                result[text] = vec
+                if cache is not None:
+                    cache.put_embedding(make_key(self.provider, self.model, text), self.model, vec)
+        return result
+
+    def _embed_query(self, text: str):
+        cache = get_kv_cache()
+        if cache is None:
+            return self.client.embed_query(text)
+
+        key = make_key(self.provider, self.model, text)
+        vec = cache.get_embedding(key)
+        if vec is None:
+            vec = self.client.embed_query(text)
+            cache.put_embedding(key, self.model, vec)
+        return vec
 
 # Register default provider(s)
 @FeatureExtractor.register("huggingface")
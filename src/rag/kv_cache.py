@@ -0,0 +1,142 @@
+"""
+SQLite KV Cache - 进程重启后依然有效的小型缓存
+
+用于缓存 LLM 的查询改写结果和 query embedding，避免重复的网络往返。
+
+Usage:
+    cache = get_kv_cache()
+    key = make_key(model, prompt)
+    value = cache.get(key)
+    if value is None:
+        cache.put(key, b"...")
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Optional
+
+from logging_config import logger
+from settings import settings
+
+
+def make_key(*parts: str) -> bytes:
+    """SHA-256(part1 || part2 || ...)，各部分之间用 \\x00 分隔"""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.digest()
+
+
+class KVCache:
+    """基于 sqlite3 (WAL) 的 KV 缓存，按写入时间保留最近 max_entries 条"""
+
+    # 每写入多少次做一次容量裁剪
+    TRIM_EVERY = 100
+    # 多个进程共用同一个 db 文件时，等待写锁的最长秒数
+    BUSY_TIMEOUT_S = 5.0
+
+    def __init__(self, path: str, max_entries: int = 10000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(path, timeout=self.BUSY_TIMEOUT_S, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key BLOB PRIMARY KEY, value BLOB, ts REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embed_cache (key BLOB PRIMARY KEY, model TEXT, vec BLOB, ts REAL)"
+        )
+        self._conn.commit()
+
+    # 缓存只是优化：读写出错（database is locked、磁盘满等）时记录日志，按未命中处理
+
+    def _read(self, sql: str, key: bytes) -> Optional[tuple]:
+        try:
+            with self._lock:
+                return self._conn.execute(sql, (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"kv cache read failed: {e}")
+            return None
+
+    def _write(self, table: str, sql: str, params: tuple) -> None:
+        with self._lock:
+            try:
+                self._conn.execute(sql, params)
+                self._conn.commit()
+                self._maybe_trim(table)
+            except sqlite3.Error as e:
+                logger.warning(f"kv cache write failed: {e}")
+                try:
+                    self._conn.rollback()
+                except sqlite3.Error:
+                    pass
+
+    # ============== 通用 KV ==============
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        row = self._read("SELECT value FROM kv WHERE key = ?", key)
+        return row[0] if row else None
+
+    def put(self, key: bytes, value: bytes) -> None:
+        self._write(
+            "kv",
+            "INSERT OR REPLACE INTO kv (key, value, ts) VALUES (?, ?, ?)",
+            (key, value, time.time()),
+        )
+
+    # ============== Embedding ==============
+
+    def get_embedding(self, key: bytes) -> Optional[list[float]]:
+        row = self._read("SELECT vec FROM embed_cache WHERE key = ?", key)
+        if not row:
+            return None
+        vec = array("f")
+        vec.frombytes(row[0])
+        return vec.tolist()
+
+    def put_embedding(self, key: bytes, model: str, vec: list[float]) -> None:
+        # float32 打包，比 JSON 紧凑得多
+        blob = array("f", vec).tobytes()
+        self._write(
+            "embed_cache",
+            "INSERT OR REPLACE INTO embed_cache (key, model, vec, ts) VALUES (?, ?, ?, ?)",
+            (key, model, blob, time.time()),
+        )
+
+    def _maybe_trim(self, table: str) -> None:
+        """调用方需持有 self._lock"""
+        self._puts += 1
+        if self._puts % self.TRIM_EVERY:
+            return
+        self._conn.execute(
+            f"DELETE FROM {table} WHERE rowid NOT IN "
+            f"(SELECT rowid FROM {table} ORDER BY ts DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self._conn.commit()
+
+
+_kv_cache: Optional[KVCache] = None
+_kv_cache_lock = threading.Lock()
+
+
+def get_kv_cache() -> Optional[KVCache]:
+    """返回全局 KVCache；未启用或打开失败时返回 None"""
+    global _kv_cache
+    if not settings.enable_kv_cache:
+        return None
+    if _kv_cache is None:
+        with _kv_cache_lock:
+            if _kv_cache is None:
+                try:
+                    _kv_cache = KVCache(settings.kv_cache_path, settings.kv_cache_max_entries)
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to open kv cache at {settings.kv_cache_path}: {e}")
+                    return None
+    return _kv_cache
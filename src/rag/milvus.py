@@ -1,7 +1,9 @@
 from pymilvus import MilvusClient, FieldSchema, DataType, CollectionSchema
-from rag.retriever import RAG, Chunk
+from rag.retriever import RAG, Chunk, bump_corpus_epoch
 from rag.feature_extractor import FeatureExtractor
 from uuid import uuid4
+import json
+import threading
 from settings import settings
 
 from langchain.embeddings import init_embeddings
@@ -9,6 +11,27 @@ from langchain.embeddings import init_embeddings
 """
 Milvus(lite) Implementation for RAG.
 """
+
+_milvus_clients: dict[tuple[str, str], MilvusClient] = {}
+_milvus_clients_lock = threading.Lock()
+
+def get_milvus_client(uri: str, token: str = "") -> MilvusClient:
+    """Return the process-wide MilvusClient for (uri, token).
+
+    A MilvusClient wraps one thread-safe gRPC channel, so every provider and
+    evaluation helper talking to the same server shares it instead of paying a
+    fresh handshake (or, for Milvus Lite, opening the same db file twice).
+    """
+    key = (uri, token)
+    # Fast path: no lock once the client exists
+    client = _milvus_clients.get(key)
+    if client is not None:
+        return client
+    with _milvus_clients_lock:
+        if key not in _milvus_clients:
+            _milvus_clients[key] = MilvusClient(uri=uri, token=token)
+        return _milvus_clients[key]
+
 class MilvusProvider(RAG):
     def __init__(self) -> None:
         super().__init__()
@@ -87,7 +110,7 @@ class MilvusProvider(RAG):
         )
 
     def _get_client(self):
-        self.client = MilvusClient(uri=self.uri, token=self.token)
+        self.client = get_milvus_client(self.uri, self.token)
         self._ensure_collection_exists(self.collection)
         return self.client
 
@@ -111,6 +134,26 @@ class MilvusProvider(RAG):
                 index_params=index_params,
             )
 
+    def use_collection(self, collection_name: str) -> str:
+        """Rebind to another collection on the same connection/embedding client; returns the previous name."""
+        previous = self.collection
+        if collection_name != previous:
+            self._ensure_collection_exists(collection_name)
+            self.collection = collection_name
+        return previous
+
+    def warmup(self) -> None:
+        """Load the collection into memory, wake the embedding model and run one tiny search."""
+        self.client.load_collection(self.collection)
+        # 直接调用底层 client，绕过 embedding 缓存，确保模型真的被加载
+        vec = self.embedding_client.client.embed_query("warmup")
+        self.client.search(
+            collection_name=self.collection,
+            data=[vec],
+            limit=1,
+            search_params=self.search_params,
+        )
+
     def query_relevant_documents(self, query: str):
         res = [] 
         # Just return an basic search result for now.
@@ -176,6 +219,7 @@ class MilvusProvider(RAG):
         }
 
         self.client.insert(collection_name=self.collection, data=data)
+        bump_corpus_epoch()
         return doc_id
     
     def insert_paper_chunks(self, doc_id: str, chunks: list[dict], paper_title: str = ""):
@@ -198,8 +242,9 @@ class MilvusProvider(RAG):
 
         print(f"Inserting {len(chunks)} chunks for doc_id: {doc_id}")
         
-        # Prepare data for insertion
+        # Prepare data for insertion; vectors are filled in afterwards with batched embedding calls
         data_list = []
+        embed_texts: list[str] = []
         
         for chunk in chunks:
             # 判断 chunk 格式并提取文本
@@ -236,11 +281,10 @@ class MilvusProvider(RAG):
                 parent_section = chunk["parent_section"]
                 page_number = chunk["page_number"]
             
-            vector = self.embedding_client.embed_query(embed_text)
+            embed_texts.append(embed_text)
             
             entry = {
                 self.doc_id_field: doc_id,
-                self.vector_field: vector,
                 self.text_field: text,
                 self.title_field: paper_title, # Store paper title for context
                 
@@ -258,6 +302,9 @@ class MilvusProvider(RAG):
                 self.conference_round_field: "",
             }
             data_list.append(entry)
+        
+        for entry, vector in zip(data_list, self.embedding_client.embed_text(embed_texts)):
+            entry[self.vector_field] = vector
             
         # Insert in batches if necessary (Milvus has limits)
         batch_size = 100
@@ -265,6 +312,7 @@ class MilvusProvider(RAG):
             batch = data_list[i:i+batch_size]
             self.client.insert(collection_name=self.collection, data=batch)
             print(f"Inserted batch {i} to {i+len(batch)}")
+        bump_corpus_epoch()
 
     def get_context_window(self, doc_id: str, center_chunk_index: int, window_size: int = 1) -> str:
         """
@@ -291,60 +339,109 @@ class MilvusProvider(RAG):
         context_text = "\n\n".join([c[self.text_field] for c in sorted_chunks])
         return context_text
 
-    def search_by_section(self, query: str, doc_id: str | None = None, 
-                          section_category: int | None = None, k: int = 5) -> list[dict]:
-        """
-        Search within specific section types or specific documents.
-        """
-        # Build filter
+    def _section_filter(self, doc_id: str | None, section_category: int | None) -> str | None:
         filters = []
         if doc_id:
             filters.append(f'{self.doc_id_field} == "{doc_id}"')
         if section_category is not None:
             filters.append(f'{self.section_category_field} == {section_category}')
-        
-        filter_expr = " && ".join(filters) if filters else ""
-        
+        return " && ".join(filters) if filters else None
+
+    def _section_output_fields(self) -> list[str]:
+        return [
+            self.title_field,
+            self.text_field,
+            self.doc_id_field,
+            self.chunk_id_field,
+            self.section_category_field,
+            self.parent_section_field,
+            self.page_number_field,
+        ]
+
+    def _section_hit_to_dict(self, hit) -> dict:
+        return {
+            "title": hit.get(self.title_field, ""),
+            "text": hit.get(self.text_field, ""),
+            "doc_id": hit.get(self.doc_id_field, ""),
+            "chunk_id": hit.get(self.chunk_id_field, -1),
+            "section_category": hit.get(self.section_category_field, 0),
+            "parent_section": hit.get(self.parent_section_field, ""),
+            "page_number": hit.get(self.page_number_field, 0),
+            "score": hit.distance if hasattr(hit, 'distance') else 0.0,
+        }
+
+    def search_by_section(self, query: str, doc_id: str | None = None, 
+                          section_category: int | None = None, k: int = 5) -> list[dict]:
+        """
+        Search within specific section types or specific documents.
+        """
         search_params = {**self.search_params}
         
         milvus_res = self.client.search(
             collection_name=self.collection,
             data=[self.embedding_client.embed_query(query)],
-            filter=filter_expr if filter_expr else None,
+            filter=self._section_filter(doc_id, section_category),
             limit=k,
             search_params=search_params,
-            output_fields=[
-                self.title_field,
-                self.text_field,
-                self.doc_id_field,
-                self.chunk_id_field,
-                self.section_category_field,
-                self.parent_section_field,
-                self.page_number_field,
-            ]
+            output_fields=self._section_output_fields()
         )
         
-        res = []
-        for hit in milvus_res[0]:
-            res.append({
-                "title": hit.get(self.title_field, ""),
-                "text": hit.get(self.text_field, ""),
-                "doc_id": hit.get(self.doc_id_field, ""),
-                "chunk_id": hit.get(self.chunk_id_field, -1),
-                "section_category": hit.get(self.section_category_field, 0),
-                "parent_section": hit.get(self.parent_section_field, ""),
-                "page_number": hit.get(self.page_number_field, 0),
-                "score": hit.distance if hasattr(hit, 'distance') else 0.0,
-            })
-        return res
+        return [self._section_hit_to_dict(hit) for hit in milvus_res[0]]
+
+    def search_by_sections_multi(self, query: str, doc_ids: list[str],
+                                 section_category: int | None = None, k: int = 5) -> list[dict]:
+        """
+        One vector search over several papers using a `doc_id in [...]` filter,
+        instead of one search (and one embedding) per doc_id. Hits come back ranked by Milvus.
+        """
+        filters = [f'{self.doc_id_field} in {json.dumps(list(doc_ids))}']
+        if section_category is not None:
+            filters.append(f'{self.section_category_field} == {section_category}')
+        
+        milvus_res = self.client.search(
+            collection_name=self.collection,
+            data=[self.embedding_client.embed_query(query)],
+            filter=" && ".join(filters),
+            limit=k,
+            search_params={**self.search_params},
+            output_fields=self._section_output_fields()
+        )
+        
+        return [self._section_hit_to_dict(hit) for hit in milvus_res[0]]
+
+    def search_by_section_batch(self, requests: list[dict]) -> list[list[dict]]:
+        """
+        Batched search_by_section: requests sharing the same filter and k are sent
+        as one multi-vector search, so N lookups cost one round-trip per distinct filter.
+        """
+        results: list[list[dict]] = [[] for _ in requests]
+        groups: dict[tuple[str | None, int], list[int]] = {}
+        for i, r in enumerate(requests):
+            key = (self._section_filter(r.get("doc_id"), r.get("section_category")), r.get("k", 5))
+            groups.setdefault(key, []).append(i)
 
-    def search_abstracts(self, query: str, k: int = 5) -> list[dict]:
+        for (filter_expr, k), indices in groups.items():
+            milvus_res = self.client.search(
+                collection_name=self.collection,
+                data=[self.embedding_client.embed_query(requests[i]["query"]) for i in indices],
+                filter=filter_expr,
+                limit=k,
+                search_params={**self.search_params},
+                output_fields=self._section_output_fields()
+            )
+            for i, hits in zip(indices, milvus_res):
+                results[i] = [self._section_hit_to_dict(hit) for hit in hits]
+        return results
+
+    def search_abstracts(self, query: str, k: int = 5, exclude_doc_ids: list[str] | None = None) -> list[dict]:
         """
         Search only in Abstract sections (section_category=0) to find relevant papers.
         Also includes paper-level entries (chunk_id=-1).
         """
         # Filter for abstracts: section_category == 0 OR chunk_id == -1 (paper-level)
         filter_expr = f'{self.section_category_field} == 0 || {self.chunk_id_field} == -1'
+        if exclude_doc_ids:
+            filter_expr = f'({filter_expr}) && {self.doc_id_field} not in {json.dumps(list(exclude_doc_ids))}'
         
         milvus_res = self.client.search(
             collection_name=self.collection,
@@ -409,6 +506,17 @@ class MilvusProvider(RAG):
         
         return intro_text
 
+    def get_section_chunks(self, doc_id: str, section_category: int) -> list[str]:
+        """Get all chunk texts of one section of a paper, ordered by chunk_id."""
+        results = self.client.query(
+            collection_name=self.collection,
+            filter=self._section_filter(doc_id, section_category),
+            output_fields=[self.text_field, self.chunk_id_field],
+            limit=500
+        )
+        sorted_chunks = sorted(results, key=lambda x: x.get(self.chunk_id_field, 0))
+        return [c[self.text_field] for c in sorted_chunks]
+
     def list_resources(self) -> list[str]:
         return [
             "Milvus Collection: " + self.collection,
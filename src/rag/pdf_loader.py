@@ -6,11 +6,13 @@ Usage:
     results = loader.load_papers(["doc_id_1", "doc_id_2"])
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import TYPE_CHECKING, Optional, Callable
 from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
 import tempfile
+import threading
 import time
 import httpx
 
@@ -76,19 +78,25 @@ class PDFLoader:
         self.download_timeout = 120  # PDF 可能较大，给足够时间
         self.max_retries = 3
         self.retry_delay = 2  # 重试间隔秒数
+        self.max_workers = 4  # 并发加载的论文数（下载是网络 I/O，解析时 PyMuPDF 也会释放 GIL）
         
         # 可选：本地缓存目录
         self.cache_dir: Path | None = None
         
         # Chunker 实例（延迟创建）
         self._chunker = None
+        self._chunker_lock = threading.Lock()
+        self._callback_lock = threading.Lock()
     
     @property
     def chunker(self):
         """获取 Chunker 实例（延迟创建）"""
         if self._chunker is None:
-            from rag.chunker import Chunker
-            self._chunker = Chunker(llm_client=self.llm_client)
+            # 多个论文并发解析时只创建一次
+            with self._chunker_lock:
+                if self._chunker is None:
+                    from rag.chunker import Chunker
+                    self._chunker = Chunker(llm_client=self.llm_client)
         return self._chunker
     
     def set_cache_dir(self, cache_dir: str | Path):
@@ -107,23 +115,46 @@ class PDFLoader:
             dict[doc_id, LoadResult] - 每个论文的加载结果
         """
         results: dict[str, LoadResult] = {}
+        doc_ids = list(dict.fromkeys(doc_ids))  # 同一篇论文只加载一次
+        if not doc_ids:
+            return results
         
-        for doc_id in doc_ids:
-            result = self._load_single_paper(doc_id)
-            results[doc_id] = result
-            
-            status_emoji = {
-                LoadStatus.SUCCESS: "✅",
-                LoadStatus.ALREADY_EXISTS: "⏭️",
-                LoadStatus.DOWNLOAD_FAILED: "❌",
-                LoadStatus.PARSE_FAILED: "❌",
-                LoadStatus.NO_PDF_URL: "⚠️",
-                LoadStatus.NOT_FOUND: "❌",
-            }.get(result.status, "❓")
-            
-            logger.info(f"{status_emoji} PDF load [{doc_id[:8]}...]: {result.status.value} - {result.message}")
+        # 每篇论文的 下载 -> 解析 -> 入库 互相独立，并发执行；一篇在等网络时另一篇可以解析
+        workers = min(self.max_workers, len(doc_ids))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-load") as pool:
+            futures = {pool.submit(self._load_single_paper_safe, doc_id): doc_id for doc_id in doc_ids}
+            for future in as_completed(futures):
+                doc_id = futures[future]
+                result = future.result()
+                results[doc_id] = result
+                self._log_load_result(doc_id, result)
+        
+        # 按请求顺序返回
+        return {doc_id: results[doc_id] for doc_id in doc_ids}
+    
+    def _load_single_paper_safe(self, doc_id: str) -> LoadResult:
+        """在线程池里运行：未预期的异常转成失败结果，不影响其他论文"""
+        try:
+            return self._load_single_paper(doc_id)
+        except Exception as e:
+            logger.error(f"PDF load [{doc_id[:8]}...] crashed: {e}")
+            return LoadResult(
+                doc_id=doc_id,
+                status=LoadStatus.PARSE_FAILED,
+                message=f"Unexpected error: {str(e)[:100]}"
+            )
+    
+    def _log_load_result(self, doc_id: str, result: LoadResult) -> None:
+        status_emoji = {
+            LoadStatus.SUCCESS: "✅",
+            LoadStatus.ALREADY_EXISTS: "⏭️",
+            LoadStatus.DOWNLOAD_FAILED: "❌",
+            LoadStatus.PARSE_FAILED: "❌",
+            LoadStatus.NO_PDF_URL: "⚠️",
+            LoadStatus.NOT_FOUND: "❌",
+        }.get(result.status, "❓")
         
-        return results
+        logger.info(f"{status_emoji} PDF load [{doc_id[:8]}...]: {result.status.value} - {result.message}")
     
     def _load_single_paper(self, doc_id: str) -> LoadResult:
         """加载单个论文的 PDF"""
@@ -190,7 +221,9 @@ class PDFLoader:
         # Step 5: 调用回调（如果设置了）- 在插入前调用，便于评估模块保存数据
         if self.on_chunks_processed:
             try:
-                self.on_chunks_processed(doc_id, chunks, title)
+                # 论文并发加载，回调串行执行，调用方不需要自己处理线程安全
+                with self._callback_lock:
+                    self.on_chunks_processed(doc_id, chunks, title)
             except Exception as e:
                 logger.warning(f"on_chunks_processed callback failed: {e}")
         
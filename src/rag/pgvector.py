@@ -1,7 +1,7 @@
 import uuid
 import psycopg2
 from psycopg2.extras import execute_values
-from rag.retriever import RAG, Chunk
+from rag.retriever import RAG, Chunk, bump_corpus_epoch
 from rag.feature_extractor import FeatureExtractor
 from settings import settings
 
@@ -130,6 +130,7 @@ class PGVectorProvider(RAG):
                 conference_round, 
                 str(doc_vector)
             ))
+        bump_corpus_epoch()
 
     def list_resources(self) -> list[str]:
         return [f"PostgreSQL Table: {self.table_name}"]
@@ -193,8 +194,11 @@ class PGVectorProvider(RAG):
                           section_category: int | None = None, k: int = 5) -> list[dict]:
         raise NotImplementedError("Structure-aware RAG not yet implemented for PGVector")
 
-    def search_abstracts(self, query: str, k: int = 5) -> list[dict]:
+    def search_abstracts(self, query: str, k: int = 5, exclude_doc_ids: list[str] | None = None) -> list[dict]:
         raise NotImplementedError("Structure-aware RAG not yet implemented for PGVector")
 
     def get_paper_introduction(self, doc_id: str) -> str:
         raise NotImplementedError("Structure-aware RAG not yet implemented for PGVector")
+
+    def get_section_chunks(self, doc_id: str, section_category: int) -> list[str]:
+        raise NotImplementedError("Structure-aware RAG not yet implemented for PGVector")
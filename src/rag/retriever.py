@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+import heapq
+import threading
 
 @dataclass
 class Chunk:
@@ -7,6 +9,21 @@ class Chunk:
     metadata: dict
     score:float
 
+# Corpus version: bumped by every insert path so in-process result caches
+# (e.g. the searcher tools) can key on it and never serve pre-insert results.
+_corpus_epoch = 0
+_corpus_epoch_lock = threading.Lock()
+
+def corpus_epoch() -> int:
+    return _corpus_epoch
+
+def bump_corpus_epoch() -> int:
+    """Mark the corpus as changed; call after any write to a vector store."""
+    global _corpus_epoch
+    with _corpus_epoch_lock:
+        _corpus_epoch += 1
+        return _corpus_epoch
+
 class RAG(ABC):
     @abstractmethod
     def query_relevant_documents(self, query: str):
@@ -71,11 +88,52 @@ class RAG(ABC):
         """
         raise NotImplementedError
 
+    def warmup(self) -> None:
+        """
+        Optional hook to pay connection / model / index loading cost ahead of the first query.
+        Default is a no-op.
+        """
+        return None
+
+    def search_by_sections_multi(self, query: str, doc_ids: list[str],
+                                 section_category: int | None = None, k: int = 5) -> list[dict]:
+        """
+        Search the same query across several documents and return the overall top-k.
+        Providers should override this with a single filtered search (doc_id IN [...]).
+        """
+        hits = [
+            hit
+            for doc_id in doc_ids
+            for hit in self.search_by_section(query, doc_id=doc_id, section_category=section_category, k=k)
+        ]
+        # 只需要前 k 个：堆选择 O(N log k)，不必全量排序
+        return heapq.nlargest(k, hits, key=lambda x: x.get("score", 0))
+
+    def search_by_section_batch(self, requests: list[dict]) -> list[list[dict]]:
+        """
+        Run several search_by_section lookups at once.
+        Args:
+            requests: List of dicts with keys query, doc_id (optional), section_category (optional), k (optional)
+        Returns:
+            One hit list per request, in the same order.
+            Providers that support multi-vector search should override this to issue fewer round-trips.
+        """
+        return [
+            self.search_by_section(
+                r["query"],
+                doc_id=r.get("doc_id"),
+                section_category=r.get("section_category"),
+                k=r.get("k", 5),
+            )
+            for r in requests
+        ]
+
     @abstractmethod
-    def search_abstracts(self, query: str, k: int = 5) -> list[dict]:
+    def search_abstracts(self, query: str, k: int = 5, exclude_doc_ids: list[str] | None = None) -> list[dict]:
         """
         Search only in Abstract sections to find relevant papers.
         Returns list of papers with their abstracts.
+        Papers in exclude_doc_ids are filtered out inside the vector search, so k new papers come back.
         """
         raise NotImplementedError
 
@@ -87,6 +145,14 @@ class RAG(ABC):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def get_section_chunks(self, doc_id: str, section_category: int) -> list[str]:
+        """
+        Get all chunk texts of one section of a paper, ordered by chunk_id.
+        Used by section-level annotation.
+        """
+        raise NotImplementedError
+
     # ============== Lazy Load PDF 相关方法 ==============
     
     @abstractmethod
@@ -127,15 +193,21 @@ class RAG(ABC):
         raise NotImplementedError
 
 _rag_clients: dict[str, RAG] = {}
+_rag_clients_lock = threading.Lock()
 
 def get_rag_client_by_provider(provider: str) -> RAG:
-    if provider not in _rag_clients:
-        if provider == 'milvus':
-            from .milvus import MilvusProvider
-            _rag_clients[provider] = MilvusProvider()
-        elif provider == 'pgvector':
-            from .pgvector import PGVectorProvider
-            _rag_clients[provider] = PGVectorProvider()
-        else:
-            raise ValueError(f"Unsupported RAG provider: {provider}")
-    return _rag_clients[provider]
\ No newline at end of file
+    # Fast path: no lock once the client exists
+    client = _rag_clients.get(provider)
+    if client is not None:
+        return client
+    with _rag_clients_lock:
+        if provider not in _rag_clients:
+            if provider == 'milvus':
+                from .milvus import MilvusProvider
+                _rag_clients[provider] = MilvusProvider()
+            elif provider == 'pgvector':
+                from .pgvector import PGVectorProvider
+                _rag_clients[provider] = PGVectorProvider()
+            else:
+                raise ValueError(f"Unsupported RAG provider: {provider}")
+        return _rag_clients[provider]
\ No newline at end of file
@@ -68,6 +68,20 @@ class Settings(BaseSettings):
     HTTPS_PROXY: Optional[str] = None
 
     enable_agentic_rag: bool = True
+    # --- Agentic search budget ---
+    agentic_max_model_calls: int = 20          # LLM calls per search run
+    agentic_timeout_s: float = 300.0           # wall-clock budget per search run
+    agentic_tool_output_max_chars: int = 4000  # truncate each tool result
+    agentic_context_trigger_tokens: int = 30000  # start clearing old tool results above this
+    agentic_keep_tool_results: int = 3         # most recent tool results kept verbatim
+    agentic_early_stop_json: bool = True       # stop streaming analysis/evaluation JSON before the trailing "reasoning"
+
+    # --- Persistent KV cache (query refinement / embeddings) ---
+    enable_kv_cache: bool = True
+    kv_cache_path: str = "cache.db"
+    kv_cache_max_entries: int = 10000
+    embedding_lru_size: int = 4096  # in-process query embedding cache
+    embedding_batch_size: int = 32  # texts per provider call when embedding many texts (indexing)
 
     model_config = SettingsConfigDict(
         env_file=".env",
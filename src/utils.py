@@ -1,14 +1,62 @@
-import requests
+import atexit
+import threading
+
+import httpx
 from logging_config import logger
 
 from bs4 import BeautifulSoup
 from parser.HTMLSelector import HTMLSelector
 
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    _HTTP2 = True
+except ModuleNotFoundError:
+    _HTTP2 = False
+
+try:
+    import brotli  # noqa: F401  httpx 解码 br 需要 brotli 或 brotlicffi
+    _BROTLI = True
+except ModuleNotFoundError:
+    try:
+        import brotlicffi  # noqa: F401
+        _BROTLI = True
+    except ModuleNotFoundError:
+        _BROTLI = False
+
+# 会议网站对无 UA 的客户端可能返回精简页或错误页；声明压缩编码让 HTML 以 br/gzip 传输
+_HTML_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "br, gzip, deflate" if _BROTLI else "gzip, deflate",
+}
+
+
+_http_client: httpx.Client | None = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """进程内共享的 HTTP 客户端：连接池复用 TCP/TLS 会话，agent 反复抓取同一站点时不再重复握手"""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    http2=_HTTP2,
+                    headers=_HTML_HEADERS,
+                    timeout=30,
+                    follow_redirects=True,
+                    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+                )
+                atexit.register(_http_client.close)
+    return _http_client
+
 
 def get_html(url, filename):
     logger.info(f"Getting HTML content for URL: {url}")
     try:
-        response = requests.get(url)
+        response = get_http_client().get(url)
         response.raise_for_status()  # Raise an error for bad status codes
         #print("Getted HTML content:", response.text)  # Print first 500 characters
         with open(f"htmls/{filename}", "w", encoding='utf-8') as f:
@@ -30,6 +30,7 @@ get_details_from_html = _utils_module.get_details_from_html
 # Import from new utils submodules
 from .trace_logger import append_jsonl, truncate_text, safe_serialize, COT_INSTRUCTION, TrajectoryCollector
 from .selector_verifier import verify_selectors
+from .json_utils import json_dumps, json_dumps_bytes, json_loads, parse_llm_json
 
 __all__ = [
     # From original utils.py
@@ -44,5 +45,9 @@ __all__ = [
     'safe_serialize',
     'COT_INSTRUCTION',
     'TrajectoryCollector',
-    'verify_selectors'
+    'verify_selectors',
+    'json_dumps',
+    'json_dumps_bytes',
+    'parse_llm_json',
+    'json_loads',
 ]
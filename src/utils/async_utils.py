@@ -0,0 +1,67 @@
+"""
+同步代码调用协程的统一入口。
+
+所有协程都跑在同一个常驻后台事件循环上。模型实例（以及 langchain-openai 内部的
+async httpx 连接池）是进程级缓存的，若每次用 asyncio.run 新建再关闭事件循环，
+第二次调用会复用绑定在已关闭循环上的连接，报 "Event loop is closed"。
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+from typing import Any, Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """返回常驻后台事件循环，首次调用时在 daemon 线程中启动"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-runner", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    在常驻事件循环上执行协程并阻塞等待结果
+
+    协程运行在调用方 ContextVar 的副本中（use_rag_client、embedding_scope 等在协程内依然生效）。
+    调用方自己处于事件循环中时也能用，但会阻塞该循环直到协程结束；异步代码应直接 await。
+    """
+    loop = _get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() called from the shared event loop; await the coroutine instead")
+
+    ctx = contextvars.copy_context()
+    result: concurrent.futures.Future = concurrent.futures.Future()
+
+    def done(task: asyncio.Task) -> None:
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def start() -> None:
+        try:
+            loop.create_task(coro, context=ctx).add_done_callback(done)
+        except BaseException as e:  # 例如循环正在关闭
+            coro.close()
+            result.set_exception(e)
+
+    loop.call_soon_threadsafe(start)
+    return result.result()
@@ -0,0 +1,64 @@
+"""
+JSON 编解码的统一入口，基于 orjson（项目依赖）。
+
+输出约定与 json.dumps(..., ensure_ascii=False) 一致（保留非 ASCII 字符）；
+dataclass、datetime 等由 orjson 原生序列化，其他类型通过 default 处理。
+"""
+import re
+from typing import Any, Callable, Optional
+
+import orjson
+
+try:
+    import json_repair
+except ModuleNotFoundError:  # pragma: no cover - fallback path
+    json_repair = None
+
+# 在 JSONL 原始字节上定位 "doc_id" 字段（group 1 为未反转义的字符串内容），不必解析整条记录
+RAW_DOC_ID_PATTERN = rb'"doc_id"\s*:\s*"((?:[^"\\]|\\.)*)"'
+
+# 匹配整段被 ``` / ```json 包裹的 LLM 输出
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*\n?(.*?)\n?\s*```$", re.DOTALL)
+
+
+def json_dumps_bytes(obj: Any, *, indent: bool = False, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """序列化为 UTF-8 bytes；indent=True 时使用 2 空格缩进"""
+    option = orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=default, option=option)
+
+
+def decode_json_string(raw: bytes) -> str:
+    """把 RAW_DOC_ID_PATTERN 等匹配到的 JSON 字符串内容还原为 str（处理 \\uXXXX、\\" 等转义）"""
+    return orjson.loads(b'"' + raw + b'"') if b"\\" in raw else raw.decode("utf-8")
+
+
+def json_dumps(obj: Any, *, indent: bool = False, default: Optional[Callable[[Any], Any]] = None) -> str:
+    """序列化为 str；indent=False 时输出紧凑格式"""
+    return json_dumps_bytes(obj, indent=indent, default=default).decode("utf-8")
+
+
+def json_loads(data: str | bytes) -> Any:
+    return orjson.loads(data)
+
+
+def parse_llm_json(content: str) -> Any:
+    """解析 LLM 返回的 JSON：去掉 markdown 代码块围栏后解析。
+
+    解析失败时，若安装了 json_repair 则尝试修复截断/轻微格式错误的 JSON，否则抛出 ValueError。
+    """
+    content = content.strip()
+    m = _FENCE_RE.match(content)
+    if m:
+        content = m.group(1).strip()
+    try:
+        return json_loads(content)
+    except ValueError:
+        if json_repair is None:
+            raise
+        repaired = json_repair.loads(content)
+        # json_repair 对完全无法解析的输入返回空字符串
+        if repaired == "":
+            raise
+        return repaired